@@ -1,5 +1,5 @@
 from datetime import timedelta
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.db.models import Sum
 from django.utils import timezone
@@ -16,6 +16,9 @@ from .models import (
     TicketSale,
 )
 from .models import Location, RoutePrice
+from .models import OutboxEvent, OutboxOffset, WaitlistEntry, ACTIVE_BOOKING_STATUSES
+from .forms import TripTransferForm
+from .disruptions import transfer_bookings, DisruptionError
 
 @admin.register(User)
 class CustomUserAdmin(DjangoUserAdmin):
@@ -34,6 +37,32 @@ class TripAdmin(admin.ModelAdmin):
     list_editable  = ('active',)
     list_filter    = ('active', 'origin', 'destination')
     search_fields  = ('origin', 'destination')
+    actions        = ['transfer_bookings']
+
+    @admin.action(description="Move all bookings to a replacement trip")
+    def transfer_bookings(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one disrupted trip.", messages.ERROR)
+            return None
+        disrupted = queryset.get()
+        form = TripTransferForm(request.POST if 'apply' in request.POST else None, disrupted=disrupted)
+        if form.is_valid():
+            try:
+                moved = transfer_bookings(disrupted.id, form.cleaned_data['replacement'].id)
+            except DisruptionError as exc:
+                self.message_user(request, str(exc), messages.ERROR)
+            else:
+                self.message_user(request, f"Moved {moved} bookings to {form.cleaned_data['replacement']}.", messages.SUCCESS)
+                return None
+        return TemplateResponse(request, "admin/bus_booking/trip/transfer_bookings.html", {
+            **self.admin_site.each_context(request),
+            'title': "Move bookings to a replacement trip",
+            'opts': self.model._meta,
+            'disrupted': disrupted,
+            'affected': Booking.objects.filter(trip=disrupted, status__in=ACTIVE_BOOKING_STATUSES).count(),
+            'form': form,
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+        })
 
 @admin.register(Bus)
 class BusAdmin(admin.ModelAdmin):
@@ -59,6 +88,7 @@ class BusInventoryAdmin(admin.ModelAdmin):
 class TicketSaleAdmin(admin.ModelAdmin):
     list_display = ('bus', 'trip', 'amount', 'date')
     list_filter = ('bus', 'trip', 'date')
+    raw_id_fields = ('booking',)
     change_list_template = "admin/bus_booking/ticketsale/change_list.html"
 
     def changelist_view(self, request, extra_context=None):
@@ -111,6 +141,22 @@ class RoutePriceAdmin(admin.ModelAdmin):
     list_filter = ('origin', 'destination')
     search_fields = ('origin__name', 'destination__name')
 
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'created_at', 'processed_at', 'attempts')
+    list_filter = ('topic', ('processed_at', admin.EmptyFieldListFilter))
+    readonly_fields = ('topic', 'payload', 'created_at', 'processed_at', 'attempts', 'last_error')
+
+
+@admin.register(OutboxOffset)
+class OutboxOffsetAdmin(admin.ModelAdmin):
+    list_display = ('consumer', 'last_event_id', 'processed_count', 'updated_at')
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('trip', 'customer', 'status', 'created_at', 'offered_seat', 'offer_expires_at')
+    list_filter = ('status',)
+
 admin.site.site_header = "Quick Transit Bus Booking System"
 admin.site.site_title = "Bus Booking Admin Portal"
 admin.site.index_title = "Welcome Our Valued User!"
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 class BusBookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bus_booking'
+
+    def ready(self):
+        # Registers system checks, outbox handlers and the signal receivers that keep the
+        # fare cache, journey index and timetable in sync with trip changes.
+        from . import checks, journeys, notifications, pricing, timetable, waitlist  # noqa: F401
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Quotes, the route matrix and their invalidations must reach every
+    worker, which a per-process cache cannot do. Allowed under DEBUG so
+    runserver and the test runner work without extra setup.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint="Set REDIS_URL or use the database cache (see CACHES in settings.py).",
+        id='bus_booking.E001',
+    )]
@@ -0,0 +1,122 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Booking, Loyalty, TicketSale, Trip, WaitlistEntry, ACTIVE_BOOKING_STATUSES
+from .outbox import publish, publish_many
+from .timetable import trips_changed
+from .waitlist import held_seats, offer_seats
+
+# Goodwill loyalty points per moved booking. The disruption request asked
+# for loyalty to be updated but set no rule; this amount is a product
+# decision to confirm with the business, not derived from anything else.
+DISRUPTION_BONUS_POINTS = 10
+
+
+class DisruptionError(Exception):
+    pass
+
+
+def transfer_bookings(disrupted_id, replacement_id):
+    """
+    Move every active booking on a disrupted trip to its replacement in one
+    transaction. Seat numbers are kept when free on the replacement and the
+    rest are remapped to the first free seats in order. The moved bookings'
+    ticket sales follow them; sales of bookings canceled or rescheduled away
+    earlier, and unlinked sales recorded before TicketSale.booking existed,
+    stay on the disrupted trip. Affected customers get
+    DISRUPTION_BONUS_POINTS per booking and the disrupted trip is
+    deactivated. Its waitlist moves along too (see move_waitlist) and any
+    seats left on the replacement are offered to the queue. All-or-nothing:
+    raises DisruptionError if the replacement cannot seat everyone.
+    Returns the number of bookings moved.
+    """
+    if disrupted_id == replacement_id:
+        raise DisruptionError("Pick a different trip as the replacement.")
+
+    with transaction.atomic():
+        trips = {t.id: t for t in Trip.objects.select_for_update(of=('self',)).select_related('bus')
+                 .filter(id__in=[disrupted_id, replacement_id])}
+        disrupted, replacement = trips.get(disrupted_id), trips.get(replacement_id)
+        if disrupted is None or replacement is None:
+            raise DisruptionError("Trip not found.")
+        if not replacement.is_available():
+            raise DisruptionError(f"{replacement} is not available for booking.")
+
+        bookings = list(Booking.objects.select_for_update()
+                        .filter(trip=disrupted, status__in=ACTIVE_BOOKING_STATUSES)
+                        .only('id', 'customer_id', 'trip_id', 'seat_number', 'status')
+                        .order_by('booking_date', 'id'))
+
+        taken = set(Booking.objects.filter(trip=replacement, status__in=ACTIVE_BOOKING_STATUSES)
+                    .values_list('seat_number', flat=True))
+        taken |= held_seats([replacement.id])[replacement.id]
+        free = [s for s in replacement.bus.seat_labels() if s not in taken]
+        if len(free) < len(bookings):
+            raise DisruptionError(
+                f"{replacement} has {len(free)} free seats for {len(bookings)} bookings."
+            )
+
+        free_set, kept = set(free), set()
+        for booking in bookings:
+            if booking.seat_number in free_set:
+                free_set.remove(booking.seat_number)
+                kept.add(booking.id)
+        remaining = iter([s for s in free if s in free_set])
+        moves = []
+        for booking in bookings:
+            old_seat = booking.seat_number
+            if booking.id not in kept:
+                booking.seat_number = next(remaining)
+            booking.trip_id = replacement.id
+            moves.append({'booking_id': booking.id, 'customer_id': booking.customer_id,
+                          'from_trip_id': disrupted.id, 'to_trip_id': replacement.id,
+                          'from_seat': old_seat, 'to_seat': booking.seat_number})
+        Booking.objects.bulk_update(bookings, ['trip', 'seat_number'], batch_size=500)
+        trips_changed([replacement.id])
+
+        TicketSale.objects.filter(booking_id__in=[b.id for b in bookings]).update(trip=replacement, bus=replacement.bus)
+
+        per_customer = Counter(b.customer_id for b in bookings)
+        Loyalty.objects.bulk_create([Loyalty(customer_id=c) for c in per_customer], ignore_conflicts=True)
+        by_count = {}
+        for customer_id, count in per_customer.items():
+            by_count.setdefault(count, []).append(customer_id)
+        for count, customer_ids in by_count.items():
+            Loyalty.objects.filter(customer_id__in=customer_ids).update(
+                points=F('points') + DISRUPTION_BONUS_POINTS * count,
+            )
+
+        waitlist_moved = move_waitlist(disrupted, replacement)
+
+        disrupted.active = False
+        disrupted.save(update_fields=['active'])
+
+        publish_many("booking.rescheduled", moves)
+        publish("trip.disrupted", trip_id=disrupted.id, replacement_trip_id=replacement.id, bookings_moved=len(moves),
+                waitlist_moved=waitlist_moved)
+        offer_seats([replacement.id])
+    return len(bookings)
+
+
+def move_waitlist(disrupted, replacement):
+    """
+    Requeue the disrupted trip's WAITING and OFFERED entries on the
+    replacement, keeping their join time so FIFO order holds. Open offers
+    revert to waiting since their seat was on the disrupted trip; customers
+    already queued on the replacement have their entry expired instead.
+    Call inside the transfer transaction. Returns the number moved.
+    """
+    open_statuses = [WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED]
+    entries = list(WaitlistEntry.objects.select_for_update()
+                   .filter(trip=disrupted, status__in=open_statuses)
+                   .values_list('id', 'customer_id'))
+    queued = set(WaitlistEntry.objects.filter(trip=replacement, status__in=open_statuses)
+                 .values_list('customer_id', flat=True))
+    WaitlistEntry.objects.filter(id__in=[pk for pk, customer in entries if customer in queued]).update(
+        status=WaitlistEntry.Statuses.EXPIRED,
+    )
+    return WaitlistEntry.objects.filter(id__in=[pk for pk, customer in entries if customer not in queued]).update(
+        trip=replacement, status=WaitlistEntry.Statuses.WAITING, offered_seat="", offer_expires_at=None,
+    )
@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.utils import timezone
 from .models import User, Trip, Bus
 
 class CustomUserCreationForm(UserCreationForm):
@@ -36,12 +37,13 @@ class CustomUserCreationForm(UserCreationForm):
 class TripForm(forms.ModelForm):
     class Meta:
         model = Trip
-        fields = ['bus', 'origin', 'destination', 'departure_time', 'price']
+        fields = ['bus', 'origin', 'destination', 'departure_time', 'arrival_time', 'price']
         widgets = {
             'bus': forms.Select(attrs={'class': 'form-control'}),
             'origin': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter origin'}),
             'destination': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter destination'}),
             'departure_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'arrival_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'price': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Enter price'}),
         }
 
@@ -56,3 +58,17 @@ class BusUpdateForm(forms.ModelForm):
             'departure_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'price': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Enter price'}),
         }
+
+class TripTransferForm(forms.Form):
+    replacement = forms.ModelChoiceField(
+        queryset=Trip.objects.none(),
+        label="Replacement trip",
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+    def __init__(self, *args, disrupted=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        trips = Trip.objects.filter(active=True, bus__is_available=True, departure_time__gt=timezone.now())
+        if disrupted is not None:
+            trips = trips.exclude(pk=disrupted.pk)
+        self.fields['replacement'].queryset = trips.select_related('bus').order_by('departure_time')
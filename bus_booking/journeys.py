@@ -0,0 +1,166 @@
+import heapq
+import itertools
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Trip
+from .timetable import changed_between, current_version
+
+# Used when a trip has no arrival_time recorded.
+DEFAULT_LEG_DURATION = timedelta(hours=4)
+MIN_CONNECTION = timedelta(minutes=30)
+# How far after depart_after the first leg may leave, and the longest wait
+# at a connection. A direct trip days away can still beat a chain of
+# earlier connections, so the first window is much wider.
+FIRST_LEG_WINDOW = timedelta(days=7)
+MAX_WAIT = timedelta(hours=24)
+MAX_LEGS = 4
+
+# Field order matters: legs sort by departure so bisect can find the first
+# departure after a given time.
+Leg = namedtuple('Leg', 'departure arrival origin destination price trip_id')
+
+
+class JourneyIndex:
+    """
+    In-memory adjacency index of upcoming trips: origin -> legs sorted by
+    departure timestamp. Supports incremental add/remove so a single trip
+    change does not require a rebuild.
+    """
+
+    def __init__(self, legs=()):
+        self.rebuild(legs)
+
+    def rebuild(self, legs):
+        self.by_origin = defaultdict(list)
+        self.legs = {}
+        for leg in legs:
+            self.legs[leg.trip_id] = leg
+            self.by_origin[leg.origin].append(leg)
+        for departures in self.by_origin.values():
+            departures.sort()
+
+    def add(self, leg):
+        self.remove(leg.trip_id)
+        self.legs[leg.trip_id] = leg
+        insort(self.by_origin[leg.origin], leg)
+
+    def remove(self, trip_id):
+        leg = self.legs.pop(trip_id, None)
+        if leg is not None:
+            departures = self.by_origin[leg.origin]
+            departures.pop(bisect_left(departures, leg))
+
+    def departures(self, location, after, max_wait):
+        departures = self.by_origin.get(location, ())
+        latest = after + max_wait
+        for i in range(bisect_left(departures, (after,)), len(departures)):
+            leg = departures[i]
+            if leg.departure > latest:
+                break
+            yield leg
+
+    def search(self, origin, destination, depart_after, optimize="arrival",
+               min_connection=MIN_CONNECTION, max_wait=MAX_WAIT, max_legs=MAX_LEGS,
+               first_leg_window=FIRST_LEG_WINDOW):
+        """
+        Time-dependent Dijkstra over trips. Each heap entry is a trip that can
+        be boarded plus the number of legs used to reach it. Neither the
+        trip's arrival nor its onward options depend on how it was reached,
+        but the remaining leg budget does: a trip is expanded again only when
+        it is popped with fewer legs used than any earlier expansion, since a
+        costlier path with legs to spare may be the only one that reaches the
+        destination within max_legs. `optimize` is "arrival" (earliest
+        arrival, then price) or "price" (cheapest, then earliest arrival).
+        The first leg must leave within first_leg_window of depart_after.
+        Times are POSIX timestamps; returns the list of Legs or None.
+        """
+        min_connection = min_connection.total_seconds()
+        max_wait = max_wait.total_seconds()
+        first_leg_window = first_leg_window.total_seconds()
+        by_price = optimize == "price"
+        counter = itertools.count()
+        heap = []
+
+        def push(leg, cost, legs_used, parent):
+            key = (cost, leg.arrival) if by_price else (leg.arrival, cost)
+            heapq.heappush(heap, (key, next(counter), leg, cost, legs_used, parent))
+
+        for leg in self.departures(origin, depart_after, first_leg_window):
+            push(leg, leg.price, 1, None)
+
+        # trip_id -> fewest legs it was expanded with; (trip_id, legs_used) -> parent state.
+        expanded, parents = {}, {}
+        while heap:
+            _, _, leg, cost, legs_used, parent = heapq.heappop(heap)
+            if expanded.get(leg.trip_id, max_legs + 1) <= legs_used:
+                continue
+            expanded[leg.trip_id] = legs_used
+            state = (leg.trip_id, legs_used)
+            parents[state] = parent
+            if leg.destination == destination:
+                path = []
+                while state is not None:
+                    path.append(self.legs[state[0]])
+                    state = parents[state]
+                return path[::-1]
+            if legs_used >= max_legs or leg.destination == origin:
+                continue
+            for nxt in self.departures(leg.destination, leg.arrival + min_connection, max_wait):
+                if expanded.get(nxt.trip_id, max_legs + 1) > legs_used + 1:
+                    push(nxt, cost + nxt.price, legs_used + 1, state)
+        return None
+
+
+def leg_for(trip_id, origin, destination, departure, arrival, price):
+    arrival = arrival or departure + DEFAULT_LEG_DURATION
+    return Leg(departure.timestamp(), arrival.timestamp(), origin, destination, float(price), trip_id)
+
+
+def load_legs(trip_ids=None):
+    trips = Trip.objects.filter(active=True, bus__is_available=True, departure_time__gt=timezone.now())
+    if trip_ids is not None:
+        trips = trips.filter(id__in=trip_ids)
+    trips = trips.values_list('id', 'origin', 'destination', 'departure_time', 'arrival_time', 'price')
+    return [leg_for(*row) for row in trips.iterator(chunk_size=5000)]
+
+
+_index = None
+_index_version = None
+
+
+def get_index():
+    """
+    The process-local index, brought up to date with the TripChange log:
+    trips changed by any process since the last sync are reloaded and
+    re-added (or dropped), and the index is rebuilt when the log no longer
+    covers the gap. Costs one query when nothing changed.
+    """
+    global _index, _index_version
+    version = current_version()
+    if _index is not None and version != _index_version:
+        changed = changed_between(_index_version, version)
+        if changed is None:
+            _index = None
+        else:
+            legs = {leg.trip_id: leg for leg in load_legs(changed)}
+            for trip_id in changed:
+                if trip_id in legs:
+                    _index.add(legs[trip_id])
+                else:
+                    _index.remove(trip_id)
+            _index_version = version
+    if _index is None:
+        _index = JourneyIndex(load_legs())
+        _index_version = version
+    return _index
+
+
+def plan_journey(origin, destination, depart_after=None, optimize="arrival", min_connection=MIN_CONNECTION,
+                 first_leg_window=FIRST_LEG_WINDOW):
+    depart_after = max(depart_after or timezone.now(), timezone.now())
+    return get_index().search(origin, destination, depart_after.timestamp(), optimize, min_connection,
+                              first_leg_window=first_leg_window)
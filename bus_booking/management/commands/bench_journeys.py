@@ -0,0 +1,62 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from bus_booking.journeys import JourneyIndex, Leg
+
+
+class Command(BaseCommand):
+    help = "Benchmark the journey planner on a synthetic network (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=300)
+        parser.add_argument('--trips', type=int, default=30000)
+        parser.add_argument('--days', type=int, default=14)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        locations = [f"L{i}" for i in range(options['locations'])]
+        # Each location links to a handful of neighbours so multi-leg journeys are needed.
+        neighbours = {loc: rng.sample(locations, 6) for loc in locations}
+        horizon = options['days'] * 86400
+
+        legs = []
+        for trip_id in range(options['trips']):
+            origin = rng.choice(locations)
+            destination = rng.choice([n for n in neighbours[origin] if n != origin])
+            departure = rng.uniform(0, horizon)
+            arrival = departure + rng.uniform(1, 8) * 3600
+            legs.append(Leg(departure, arrival, origin, destination, float(rng.randint(300, 3000)), trip_id))
+
+        started = time.perf_counter()
+        index = JourneyIndex(legs)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for leg in legs[:1000]:
+            index.remove(leg.trip_id)
+            index.add(leg)
+        update_us = (time.perf_counter() - started) * 1e6 / 2000
+
+        for optimize in ("arrival", "price"):
+            timings, found = [], 0
+            for _ in range(options['queries']):
+                origin, destination = rng.sample(locations, 2)
+                started = time.perf_counter()
+                path = index.search(origin, destination, rng.uniform(0, horizon / 2), optimize)
+                timings.append((time.perf_counter() - started) * 1000)
+                found += path is not None
+            timings.sort()
+            self.stdout.write(
+                f"{optimize:>7}: {found}/{len(timings)} found, "
+                f"median {statistics.median(timings):.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, max {timings[-1]:.2f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Index of {len(legs)} trips over {len(locations)} locations built in {build_ms:.1f} ms; "
+            f"incremental update {update_us:.1f} us/op."
+        ))
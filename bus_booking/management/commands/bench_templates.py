@@ -0,0 +1,62 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.utils import timezone
+
+from bus_booking.models import Booking, Bus, Trip, User
+
+
+class Command(BaseCommand):
+    help = "Benchmark rendering of the customer and admin dashboards with in-memory rows (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, action='append', help="Row counts to render (repeatable). Default: 1000 and 10000.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        for rows in options['rows'] or [1000, 10000]:
+            context = self.fake_context(rows)
+            request.user = context['user']
+            for name in ('bus_booking/customer_dashboard.html', 'bus_booking/admin_dashboard.html'):
+                template = get_template(name)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    html = template.render(context, request)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"{name:<40} {rows:>6} rows: median {statistics.median(timings):8.1f} ms, "
+                    f"min {min(timings):8.1f} ms, {len(html) // 1024} KiB"
+                )
+
+    def fake_context(self, rows):
+        from bus_booking.views import dashboard_urls
+
+        now = timezone.now()
+        user = User(id=1, username="customer", role=User.Roles.CUSTOMER)
+        bus = Bus(id=1, bus="KBX 123A", origin="Nairobi", destination="Mombasa",
+                  departure_time=now, price=Decimal("1500.00"))
+        trips, bookings = [], []
+        statuses = ["BOOKED", "PAID", "FREE", "CANCELED", "RESCHEDULED"]
+        for i in range(1, rows + 1):
+            trip = Trip(id=i, bus=bus, origin="Nairobi", destination="Mombasa",
+                        departure_time=now + timedelta(hours=i), price=Decimal("1500.00"))
+            booking = Booking(id=i, customer=user, trip=trip, seat_number="1A",
+                              status=statuses[i % len(statuses)], loyalty_points=5)
+            booking.booking_date = now
+            trips.append(trip)
+            bookings.append(booking)
+        return {
+            'user': user,
+            'trips': trips,
+            'bookings': bookings,
+            'buses': trips,
+            'urls': dashboard_urls(),
+            'eligible_for_free_trip': False,
+        }
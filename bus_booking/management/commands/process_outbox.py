@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+
+from bus_booking import outbox
+
+
+class Command(BaseCommand):
+    help = ("Process pending outbox events in batches. Claims rows with SKIP LOCKED, so several "
+            "workers can run side by side and split the queue between them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--once', action='store_true', help="Drain the outbox and exit instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = outbox.process_batch(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total} events; {outbox.pending_count()} pending, oldest pending {outbox.lag()}."
+        ))
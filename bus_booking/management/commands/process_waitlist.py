@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+
+from bus_booking import waitlist
+
+
+class Command(BaseCommand):
+    help = "Expire lapsed waitlist offers and offer free seats to the next customers in line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Repeat every N seconds instead of running once.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            offers = waitlist.sweep()
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f"Made {len(offers)} waitlist offers in {elapsed:.1f} ms."))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
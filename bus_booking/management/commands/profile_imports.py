@@ -0,0 +1,50 @@
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = "Profile module import time with `python -X importtime` in a fresh interpreter."
+
+    def add_arguments(self, parser):
+        parser.add_argument('module', nargs='?', default='bus_booking_project.wsgi',
+                            help="Module to import after django.setup(). Default: the WSGI entry point.")
+        parser.add_argument('--top', type=int, default=25, help="Show the N slowest imports by cumulative time.")
+        parser.add_argument('--self', action='store_true', dest='by_self', help="Sort by self time instead.")
+
+    def handle(self, *args, **options):
+        # Load the URLconf as well: that is what imports the views on a
+        # worker's first request.
+        code = (f"import django; django.setup(); import {options['module']}; "
+                "from django.urls import get_resolver; get_resolver().url_patterns")
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, env=os.environ.copy(),
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        rss_mib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+        rows = []
+        for line in result.stderr.splitlines():
+            match = LINE.match(line)
+            if match:
+                rows.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+        total_ms = sum(row[0] for row in rows) / 1000
+
+        rows.sort(key=lambda row: row[0 if options['by_self'] else 1], reverse=True)
+        self.stdout.write(f"{'self ms':>9} {'cumul ms':>9}  module")
+        for self_us, cumulative_us, depth, name in rows[:options['top']]:
+            self.stdout.write(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {'  ' * min(depth, 4)}{name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} modules, {total_ms:.0f} ms importing, {wall_ms:.0f} ms wall, peak RSS {rss_mib:.0f} MiB."
+        ))
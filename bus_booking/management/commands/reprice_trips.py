@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+
+from bus_booking import pricing
+
+
+class Command(BaseCommand):
+    help = "Recompute cached fares for all upcoming trips from RoutePrice, lead time, occupancy and weekday rules."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Repeat every N seconds instead of running once.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = pricing.reprice_upcoming_trips()
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f"Repriced {count} trips in {elapsed:.1f} ms."))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
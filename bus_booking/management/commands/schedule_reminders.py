@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from bus_booking import notifications
+
+
+class Command(BaseCommand):
+    help = "Queue departure reminders for trips leaving within the next 24 hours. Run from cron."
+
+    def handle(self, *args, **options):
+        queued = notifications.schedule_departure_reminders()
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} reminders (duplicates are skipped)."))
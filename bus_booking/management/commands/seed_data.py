@@ -0,0 +1,281 @@
+import io
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from bus_booking import pricing, timetable
+from bus_booking.models import (
+    Booking, Bus, BusInventory, Location, Loyalty, RoutePrice, TicketSale, Trip, User,
+)
+
+TOWNS = [
+    "Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika", "Malindi", "Kitale", "Garissa", "Kakamega",
+    "Nyeri", "Machakos", "Meru", "Kericho", "Naivasha", "Embu", "Lamu", "Voi", "Narok", "Bungoma",
+    "Busia", "Isiolo", "Kisii", "Nanyuki", "Homa Bay", "Migori", "Kitui", "Nyahururu", "Webuye", "Mumias",
+]
+FLEET = ["Easy Coach", "Modern Coast", "Guardian", "Mash Poa", "Dreamline", "Tahmeed", "Coast Bus", "Spanish"]
+
+# (status, weight). Trips that have departed settle into paid, cancelled or
+# moved bookings; upcoming trips still carry unpaid reservations.
+PAST_STATUS_MIX = [("PAID", 62), ("FREE", 7), ("CANCELED", 16), ("RESCHEDULED", 7), ("BOOKED", 8)]
+FUTURE_STATUS_MIX = [("BOOKED", 45), ("PAID", 35), ("FREE", 5), ("CANCELED", 10), ("RESCHEDULED", 5)]
+# Bookings that went through payment_page and so have a TicketSale.
+SOLD_STATUSES = {"PAID", "CANCELED", "RESCHEDULED"}
+# Percent of the base fare actually paid, standing in for dynamic pricing.
+FARE_MULTIPLIERS = (90, 100, 100, 105, 115, 125)
+INVENTORY_MIX = [("NEW", 50), ("REPAIRED", 35), ("NOT_SERVICED", 15)]
+
+PRICE_PER_KM = 4.5
+AVERAGE_SPEED_KMH = 60
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the given auto_now_add values instead of stamping now()."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+class CopyWriter:
+    """Buffers rows and streams them into a table with PostgreSQL COPY."""
+
+    def __init__(self, model, columns, batch_size):
+        self.table = connection.ops.quote_name(model._meta.db_table)
+        self.columns = columns
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        data = io.StringIO("".join(
+            "\t".join(r"\N" if value is None else str(value) for value in row) + "\n" for row in self.rows
+        ))
+        sql = f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN"
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, data)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(data.getvalue())
+        self.count += len(self.rows)
+        self.rows = []
+
+
+class BulkWriter(CopyWriter):
+    """Same interface as CopyWriter, using bulk_create on other databases."""
+
+    def __init__(self, model, columns, batch_size):
+        super().__init__(model, columns, batch_size)
+        self.model = model
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.model.objects.bulk_create(
+            [self.model(**dict(zip(self.columns, row))) for row in self.rows], batch_size=self.batch_size,
+        )
+        self.count += len(self.rows)
+        self.rows = []
+
+
+class Command(BaseCommand):
+    help = "Fill the database with reproducible synthetic locations, fleet, trips, bookings and sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=30)
+        parser.add_argument('--buses', type=int, default=300)
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--years', type=float, default=2, help="Years of trip history before the anchor date.")
+        parser.add_argument('--days-ahead', type=int, default=60, help="Days of scheduled trips after the anchor date.")
+        parser.add_argument('--trips-per-day', type=int, default=150)
+        parser.add_argument('--bookings', type=int, default=1000000, help="Approximate number of bookings.")
+        parser.add_argument('--anchor-date', type=date.fromisoformat, default=None,
+                            help="Treat this date (YYYY-MM-DD) as today, for identical data across runs.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--password', default="quicktransit", help="Password for every generated customer.")
+        parser.add_argument('--no-copy', action='store_true', help="Use bulk_create even on PostgreSQL.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith="seed_").exists():
+            raise CommandError("Seed data is already present; run against a fresh database.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.writer = BulkWriter if options['no_copy'] or connection.vendor != 'postgresql' else CopyWriter
+        tz = timezone.get_current_timezone()
+        anchor = options['anchor_date'] or timezone.localdate()
+        self.now = datetime.combine(anchor, dtime(12), tzinfo=tz)
+        started = time.perf_counter()
+
+        towns = self.step("locations and route prices", self.seed_locations, options['locations'])
+        buses = self.step("buses and inventory", self.seed_buses, options['buses'], towns)
+        customers = self.step("customers", self.seed_customers, options['customers'], options['password'])
+        trips = self.step("trips", self.seed_trips, buses, options['trips_per_day'],
+                          int(options['years'] * 365), options['days_ahead'])
+        bookings, sales = self.step("bookings and ticket sales", self.seed_bookings, trips, customers,
+                                    options['bookings'])
+        self.invalidate_caches()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(towns)} locations, {len(buses)} buses, {len(customers)} customers, {len(trips)} trips, "
+            f"{bookings} bookings and {sales} ticket sales in {time.perf_counter() - started:.1f}s "
+            f"using {'COPY' if self.writer is CopyWriter else 'bulk_create'}."
+        ))
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f"  {label}: {time.perf_counter() - started:.1f}s")
+        return result
+
+    def seed_locations(self, count):
+        """Locations on a plane; route prices and durations follow the distance between them."""
+        names = (TOWNS + [f"Town {i}" for i in range(len(TOWNS), count)])[:count]
+        locations = Location.objects.bulk_create([Location(name=name) for name in names])
+        coords = {loc.name: (self.rng.uniform(0, 800), self.rng.uniform(0, 800)) for loc in locations}
+        routes = {}
+        for origin in locations:
+            for destination in locations:
+                if origin is not destination:
+                    km = max(math.dist(coords[origin.name], coords[destination.name]), 40)
+                    routes[origin.name, destination.name] = (
+                        Decimal(max(round(km * PRICE_PER_KM / 50) * 50, 200)),
+                        timedelta(hours=km / AVERAGE_SPEED_KMH + 0.5),
+                    )
+        by_name = {loc.name: loc for loc in locations}
+        RoutePrice.objects.bulk_create(
+            [RoutePrice(origin=by_name[o], destination=by_name[d], price=price) for (o, d), (price, _) in routes.items()],
+            batch_size=self.batch_size,
+        )
+        # Keep the busiest corridors (the first towns) most frequent.
+        self.route_keys = list(routes)
+        self.route_weights = [1 / (names.index(o) + names.index(d) + 2) for o, d in self.route_keys]
+        self.routes = routes
+        return names
+
+    def seed_buses(self, count, towns):
+        buses = []
+        for i in range(count):
+            origin, destination = self.rng.sample(towns, 2)
+            seats = self.rng.choice([33, 44, 49, 60])
+            buses.append(Bus(
+                bus=f"{self.rng.choice(FLEET)} K{chr(65 + i % 26)}{chr(65 + i // 26 % 26)} {100 + i % 900}",
+                origin=origin, destination=destination, departure_time=self.now, price=self.routes[origin, destination][0],
+                total_seats=seats, seats_per_row=3 if seats == 33 else 4,
+                is_available=self.rng.random() > 0.05,
+            ))
+        buses = Bus.objects.bulk_create(buses, batch_size=self.batch_size)
+        statuses, weights = zip(*INVENTORY_MIX)
+        BusInventory.objects.bulk_create([
+            BusInventory(bus=bus, status=self.rng.choices(statuses, weights)[0],
+                         purchase_date=self.now.date() - timedelta(days=self.rng.randint(30, 3650)))
+            for bus in buses
+        ], batch_size=self.batch_size)
+        return buses
+
+    def seed_customers(self, count, password):
+        password = make_password(password)  # hashing once keeps this step in seconds
+        users = [
+            User(username=f"seed_customer_{i}", email=f"seed_customer_{i}@example.com", password=password,
+                 role=User.Roles.CUSTOMER, phone_number=f"07{self.rng.randint(10000000, 99999999)}",
+                 date_joined=self.now - timedelta(days=self.rng.randint(0, 1500)))
+            for i in range(count)
+        ]
+        return [user.id for user in User.objects.bulk_create(users, batch_size=self.batch_size)]
+
+    def seed_trips(self, buses, per_day, days_back, days_ahead):
+        """bulk_create the trips and return (id, bus_id, departure, price, seat labels) for booking generation."""
+        fleet = [bus for bus in buses if bus.is_available]
+        labels = {bus.id: bus.seat_labels() for bus in buses}
+        midnight = self.now.replace(hour=0)
+        trips = []
+        for day in range(-days_back, days_ahead):
+            routes = self.rng.choices(self.route_keys, self.route_weights, k=per_day)
+            for origin, destination in routes:
+                price, duration = self.routes[origin, destination]
+                departure = midnight + timedelta(days=day, minutes=self.rng.randrange(5 * 60, 23 * 60, 15))
+                trips.append(Trip(bus=self.rng.choice(fleet), origin=origin, destination=destination,
+                                  departure_time=departure, arrival_time=departure + duration, price=price,
+                                  active=self.rng.random() > 0.01))
+        trips = Trip.objects.bulk_create(trips, batch_size=self.batch_size)
+        return [(t.id, t.bus_id, t.departure_time, t.price, labels[t.bus_id]) for t in trips]
+
+    def seed_bookings(self, trips, customers, target):
+        """
+        Stream bookings and ticket sales straight to the database. Seats on a
+        trip are distinct; upcoming trips fill up as departure approaches.
+        Booking ids are assigned here, since COPY cannot return them, so each
+        sale can point at its booking; the id sequence is reset afterwards.
+        """
+        next_id = (Booking.objects.aggregate(latest=Max('id'))['latest'] or 0) + 1
+        with explicit_timestamps(Booking._meta.get_field('booking_date'), TicketSale._meta.get_field('date')):
+            bookings = self.writer(Booking, ['id', 'customer_id', 'trip_id', 'booking_date', 'seat_number', 'status',
+                                             'loyalty_points'], self.batch_size)
+            sales = self.writer(TicketSale, ['bus_id', 'trip_id', 'booking_id', 'amount', 'date'], self.batch_size)
+            past_statuses, past_weights = zip(*PAST_STATUS_MIX)
+            future_statuses, future_weights = zip(*FUTURE_STATUS_MIX)
+            average = target / len(trips) if trips else 0
+            horizon = max((trips[-1][2] - self.now).total_seconds(), 1) if trips else 1
+            points = {}
+
+            for trip_id, bus_id, departure, price, labels in trips:
+                fares = [(price * m / 100).quantize(Decimal('1')) for m in FARE_MULTIPLIERS]
+                ahead = (departure - self.now).total_seconds()
+                fill = 1.0 if ahead <= 0 else max(0.05, 1 - ahead / horizon)
+                count = min(len(labels), round(average * fill * self.rng.uniform(0.5, 1.5)))
+                if ahead <= 0:
+                    statuses = self.rng.choices(past_statuses, past_weights, k=count)
+                else:
+                    statuses = self.rng.choices(future_statuses, future_weights, k=count)
+                for seat, status in zip(self.rng.sample(labels, count), statuses):
+                    customer_id = self.rng.choice(customers)
+                    booked_at = min(departure - timedelta(hours=self.rng.expovariate(1 / 72) + 0.5), self.now)
+                    loyalty = 5 if status in ("BOOKED", "PAID") else 0
+                    points[customer_id] = points.get(customer_id, 0) + loyalty
+                    bookings.add((next_id, customer_id, trip_id, booked_at, seat, status, loyalty))
+                    if status in SOLD_STATUSES:
+                        sales.add((bus_id, trip_id, next_id, self.rng.choice(fares), booked_at))
+                    next_id += 1
+            bookings.flush()
+            sales.flush()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Booking]):
+                cursor.execute(sql)
+
+        Loyalty.objects.bulk_create(
+            [Loyalty(customer_id=customer_id, points=total % 100, free_trip_eligible=total >= 100)
+             for customer_id, total in points.items()],
+            batch_size=self.batch_size,
+        )
+        return bookings.count, sales.count
+
+    def invalidate_caches(self):
+        """bulk_create skips signals, so drop the derived caches and log the new trips by hand."""
+        cache.delete_many([pricing.ROUTE_MATRIX_KEY, pricing.ROUTE_MATRIX_BY_ID_KEY])
+        timetable.log_changes(Trip.objects.filter(departure_time__gt=timezone.now()).values_list('id', flat=True))
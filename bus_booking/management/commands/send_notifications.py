@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+
+from bus_booking import notifications
+from bus_booking.models import Notification
+
+
+class Command(BaseCommand):
+    help = ("Send queued SMS/email notifications in rate-limited batches. Workers share each "
+            "channel's RATE_PER_SECOND through RATE_LIMIT_BACKEND = 'cache'; with 'local' run "
+            "one worker per channel.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', choices=Notification.Channels.values, action='append',
+                            help="Only send on this channel (repeatable). Defaults to all channels.")
+        parser.add_argument('--once', action='store_true', help="Send everything that is due and exit.")
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        channels = options['channel'] or Notification.Channels.values
+        sent = failed = 0
+        while True:
+            busy = False
+            for channel in channels:
+                ok, bad = notifications.dispatch(channel)
+                sent, failed = sent + ok, failed + bad
+                busy = busy or bool(ok or bad)
+            if busy:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} notifications, {failed} failed or deferred."))
@@ -0,0 +1,109 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+
+from . import ratelimit
+
+# ManifestStaticFilesStorage appends a 12 character md5 prefix before the extension.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=300"
+
+
+class StaticFilesMiddleware:
+    """
+    Serve collected static files from STATIC_ROOT when DEBUG is off.
+
+    Hashed filenames get far-future immutable caching; anything else a short
+    max-age. Pre-compressed .br/.gz siblings written by
+    CompressedManifestStaticFilesStorage are sent when the client accepts
+    them. A front-end web server can do the same job; this keeps a bare
+    gunicorn deployment fast without one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = settings.STATIC_ROOT
+        self.enabled = not settings.DEBUG and bool(self.root) and '://' not in settings.STATIC_URL
+
+    def __call__(self, request):
+        if self.enabled and request.path.startswith(self.prefix) and request.method in ('GET', 'HEAD'):
+            return self.serve(request, request.path[len(self.prefix):])
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(path):
+            raise Http404
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in accepted and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, candidate
+                break
+
+        # Name the asset itself, not the .br/.gz sibling actually opened.
+        response = FileResponse(open(path, 'rb'), content_type=content_type, filename=os.path.basename(name))
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE if HASHED_NAME.search(name) else REVALIDATE
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Apply settings.RATE_LIMITS to views by URL name before the view runs.
+
+    Rules keyed 'ip' are checked first and cost no database work, so
+    traffic over an IP limit is rejected before any query. Rules keyed
+    'user' read the user id from the session rather than loading the user;
+    with the default database sessions that is one django_session SELECT,
+    skipped for requests without a session cookie, which are limited by
+    client IP instead. Excess requests get a 429 with Retry-After.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ip_header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def client_ip(self, request):
+        if self.ip_header and request.META.get(self.ip_header):
+            return request.META[self.ip_header].split(',')[0].strip()
+        return request.META.get('REMOTE_ADDR', '')
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        rules = ratelimit.rules_for(url_name, request.method) if url_name else []
+        if not rules:
+            return None
+
+        backend = ratelimit.get_backend()
+        ip = self.client_ip(request)
+        for rule in sorted(rules, key=lambda r: r['key'] != 'ip'):
+            ident = f"ip:{ip}"
+            if rule['key'] == 'user' and settings.SESSION_COOKIE_NAME in request.COOKIES:
+                user_id = request.session.get(SESSION_KEY)
+                ident = f"user:{user_id}" if user_id else ident
+            limit, period = ratelimit.parse_rate(rule['rate'])
+            retry = backend.hit(f"{url_name}:{rule['key']}:{ident}", limit, period)
+            if retry:
+                response = HttpResponse("Too many requests. Please slow down.", status=429, content_type="text/plain")
+                response['Retry-After'] = str(int(retry) + 1)
+                return response
+        return None
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_booking', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='arrival_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_booking', '0007_trip_arrival_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('CONFIRMATION', 'Booking confirmation'), ('REMINDER', 'Departure reminder'), ('CANCELLATION', 'Cancellation notice'), ('WAITLIST_OFFER', 'Waitlist seat offer')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('OFFERED', 'Seat offered'), ('ACCEPTED', 'Accepted'), ('DECLINED', 'Declined'), ('EXPIRED', 'Expired')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('offered_seat', models.CharField(blank=True, max_length=3)),
+                ('offer_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bus_booking.trip')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trip', 'status', 'created_at'], name='waitlist_fifo_idx'), models.Index(condition=models.Q(('status', 'OFFERED')), fields=['offer_expires_at'], name='waitlist_offer_expiry_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['WAITING', 'OFFERED'])), fields=('trip', 'customer'), name='waitlist_one_open_entry_per_trip')],
+            },
+        ),
+    ]
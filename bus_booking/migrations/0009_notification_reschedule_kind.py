@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_booking', '0008_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('CONFIRMATION', 'Booking confirmation'), ('REMINDER', 'Departure reminder'), ('CANCELLATION', 'Cancellation notice'), ('RESCHEDULE', 'Reschedule notice'), ('WAITLIST_OFFER', 'Waitlist seat offer')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_booking', '0011_notification_canceled_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketsale',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='bus_booking.booking'),
+        ),
+    ]
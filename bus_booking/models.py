@@ -17,6 +17,15 @@ class User(AbstractUser):
         choices=Roles.choices,
         default=Roles.CUSTOMER,
     )
+    phone_number = models.CharField(
+        max_length=13,
+        blank=True,
+        validators=[RegexValidator(
+            regex=r'^(?:07\d{8}|\+2547\d{8})$',
+            message="Enter a valid Safaricom number, e.g. 07XXXXXXXX or +2547XXXXXXXX",
+        )],
+        help_text="Store as 07XXXXXXXX or +2547XXXXXXXX",
+    )
 
     def save(self, *args, **kwargs):
         if self.is_superuser:
@@ -42,10 +51,16 @@ class Bus(models.Model):
     def is_departure_soon(self):
         return self.departure_time <= (timezone.now() + timedelta(days=1))
 
+    def seat_labels(self):
+        rows = self.total_seats // self.seats_per_row
+        letters = list("ABCD")[:self.seats_per_row]
+        return [f"{r+1}{letters[c]}" for r in range(rows) for c in range(len(letters))]
+
 
 class Trip(models.Model):
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE)
-    departure_time = models.DateTimeField()
+    departure_time = models.DateTimeField(db_index=True)
+    arrival_time = models.DateTimeField(null=True, blank=True)
     origin = models.CharField(max_length=100)
     destination = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -58,6 +73,8 @@ class Trip(models.Model):
         return self.bus.is_available and self.active and self.departure_time > timezone.now()
 
 
+ACTIVE_BOOKING_STATUSES = ["BOOKED", "PAID", "FREE", "RESCHEDULED"]
+
 seat_validator = RegexValidator(r'^\d{1,2}[A-Z]$', "Seat must be like '1A', '12B', etc.")
 
 
@@ -84,6 +101,12 @@ class Booking(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="BOOKED")
     loyalty_points = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a customer's booking history.
+            models.Index(fields=['customer', '-booking_date', '-id'], name='booking_customer_history_idx'),
+        ]
+
     def __str__(self):
         return f"{self.customer.username} - {self.trip} (Seat {self.seat_number})"
 
@@ -162,6 +185,8 @@ class BusInventory(models.Model):
 class TicketSale(models.Model):
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE)
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
+    # Null for sales recorded before bookings were linked.
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     date = models.DateTimeField(auto_now_add=True)
 
@@ -186,3 +211,118 @@ class RoutePrice(models.Model):
 
     def __str__(self):
         return f"{self.origin} to {self.destination}: {self.price}"
+
+
+class OutboxEvent(models.Model):
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk}"
+
+
+class OutboxOffset(models.Model):
+    consumer = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    processed_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.last_event_id}"
+
+
+class Notification(models.Model):
+    class Channels(models.TextChoices):
+        SMS = "SMS", _("SMS")
+        EMAIL = "EMAIL", _("Email")
+
+    class Kinds(models.TextChoices):
+        CONFIRMATION = "CONFIRMATION", _("Booking confirmation")
+        REMINDER = "REMINDER", _("Departure reminder")
+        CANCELLATION = "CANCELLATION", _("Cancellation notice")
+        RESCHEDULE = "RESCHEDULE", _("Reschedule notice")
+        WAITLIST_OFFER = "WAITLIST_OFFER", _("Waitlist seat offer")
+
+    class Statuses(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        SENT = "SENT", _("Sent")
+        FAILED = "FAILED", _("Failed")
+        CANCELED = "CANCELED", _("Withdrawn")
+
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, null=True, blank=True)
+    channel = models.CharField(max_length=10, choices=Channels.choices)
+    kind = models.CharField(max_length=20, choices=Kinds.choices)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    dedupe_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['channel', 'next_attempt_at'], condition=models.Q(status="PENDING"), name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.recipient} ({self.status})"
+
+
+class WaitlistEntry(models.Model):
+    class Statuses(models.TextChoices):
+        WAITING = "WAITING", _("Waiting")
+        OFFERED = "OFFERED", _("Seat offered")
+        ACCEPTED = "ACCEPTED", _("Accepted")
+        DECLINED = "DECLINED", _("Declined")
+        EXPIRED = "EXPIRED", _("Expired")
+
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    offered_seat = models.CharField(max_length=3, blank=True)
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['trip', 'customer'],
+                condition=models.Q(status__in=["WAITING", "OFFERED"]),
+                name='waitlist_one_open_entry_per_trip',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['trip', 'status', 'created_at'], name='waitlist_fifo_idx'),
+            models.Index(fields=['offer_expires_at'], condition=models.Q(status="OFFERED"), name='waitlist_offer_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer.username} waiting for {self.trip} ({self.status})"
+
+
+class TripChange(models.Model):
+    """
+    Append-only log of trips whose schedule, fare or free seats changed.
+    The id doubles as a version number shared by every process: the
+    timetable snapshot and journey index catch up by reading rows past the
+    last id they saw. trip_id is not a foreign key so deletions are logged.
+    """
+    trip_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Trip {self.trip_id} changed (#{self.pk})"
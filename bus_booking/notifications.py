@@ -0,0 +1,274 @@
+import json
+import sys
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import ratelimit
+from .models import Booking, Notification, ACTIVE_BOOKING_STATUSES
+from .outbox import handles
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_CAP = timedelta(hours=1)
+CLAIM_TIMEOUT = timedelta(minutes=5)
+REMINDER_WINDOW = timedelta(days=1)
+
+# Override per channel with settings.NOTIFICATION_PROVIDERS.
+DEFAULT_PROVIDERS = {
+    Notification.Channels.SMS: {
+        'BACKEND': 'bus_booking.notifications.ConsoleBackend',
+        'RATE_PER_SECOND': 10,
+        'BATCH_SIZE': 50,
+    },
+    Notification.Channels.EMAIL: {
+        'BACKEND': 'bus_booking.notifications.ConsoleBackend',
+        'RATE_PER_SECOND': 20,
+        'BATCH_SIZE': 100,
+    },
+}
+
+
+class BaseBackend:
+    """
+    A notification provider. send_messages() receives a list of Notification
+    rows and returns a list of the same length holding None for each message
+    that was accepted or an error string for each one that was not.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send_messages(self, notifications):
+        raise NotImplementedError
+
+
+class ConsoleBackend(BaseBackend):
+    def send_messages(self, notifications):
+        stream = self.options.get('stream') or sys.stdout
+        for n in notifications:
+            stream.write(f"[{n.channel}] to={n.recipient} subject={n.subject!r}\n{n.body}\n\n")
+        stream.flush()
+        return [None] * len(notifications)
+
+
+class FileBackend(BaseBackend):
+    """Append one JSON line per message to OPTIONS['PATH']; handy for tests."""
+
+    def send_messages(self, notifications):
+        with open(self.options['PATH'], 'a', encoding='utf-8') as fh:
+            for n in notifications:
+                fh.write(json.dumps({
+                    'id': n.id, 'channel': n.channel, 'kind': n.kind,
+                    'recipient': n.recipient, 'subject': n.subject, 'body': n.body,
+                }) + "\n")
+        return [None] * len(notifications)
+
+
+class DjangoEmailBackend(BaseBackend):
+    """Send EMAIL notifications through Django's configured EMAIL_BACKEND."""
+
+    def send_messages(self, notifications):
+        from django.core.mail import EmailMessage, get_connection
+        results = []
+        with get_connection() as connection:
+            for n in notifications:
+                try:
+                    EmailMessage(n.subject, n.body, to=[n.recipient], connection=connection).send()
+                    results.append(None)
+                except Exception as exc:
+                    results.append(repr(exc))
+        return results
+
+
+class Provider:
+    def __init__(self, channel, config):
+        self.channel = channel
+        self.batch_size = config.get('BATCH_SIZE', 50)
+        self.rate = config.get('RATE_PER_SECOND', 10)
+        self.backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+    def throttle(self, amount):
+        """
+        Block until `amount` messages may go out under RATE_PER_SECOND. The
+        budget lives in the rate-limit backend (see bus_booking.ratelimit),
+        so with RATE_LIMIT_BACKEND = 'cache' it is shared by every
+        send_notifications worker; with 'local' it is per process and only
+        one worker per channel should run.
+        """
+        backend = ratelimit.get_backend()
+        for _ in range(amount):
+            while retry := backend.hit(f"notify:{self.channel}", self.rate, 1):
+                time.sleep(retry)
+
+
+_providers = {}
+
+
+def get_provider(channel):
+    if channel not in _providers:
+        config = getattr(settings, 'NOTIFICATION_PROVIDERS', DEFAULT_PROVIDERS)[channel]
+        _providers[channel] = Provider(channel, config)
+    return _providers[channel]
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_CAP)
+
+
+def render(booking, kind):
+    trip = booking.trip
+    when = timezone.localtime(trip.departure_time).strftime("%d %b %Y %H:%M")
+    if kind == Notification.Kinds.CONFIRMATION:
+        subject = "QuickTransit booking confirmed"
+        body = f"Your seat {booking.seat_number} on {trip.origin} to {trip.destination} at {when} is confirmed."
+    elif kind == Notification.Kinds.REMINDER:
+        subject = "QuickTransit departure reminder"
+        body = f"Reminder: your bus from {trip.origin} to {trip.destination} departs at {when}. Seat {booking.seat_number}."
+    elif kind == Notification.Kinds.RESCHEDULE:
+        subject = "QuickTransit booking moved"
+        body = (f"Your booking has been moved to {trip.origin} to {trip.destination} at {when}, "
+                f"seat {booking.seat_number}.")
+    else:
+        subject = "QuickTransit booking canceled"
+        body = f"Your booking for {trip.origin} to {trip.destination} at {when} has been canceled."
+    return subject, body
+
+
+def build_notifications(booking, kind):
+    """One Notification per channel the customer can be reached on."""
+    subject, body = render(booking, kind)
+    customer = booking.customer
+    recipients = [
+        (Notification.Channels.EMAIL, customer.email),
+        (Notification.Channels.SMS, customer.phone_number),
+    ]
+    return [
+        Notification(
+            customer=customer, booking=booking, channel=channel, kind=kind,
+            recipient=recipient, subject=subject, body=body,
+            # The trip is part of the key so a booking moved to another trip
+            # gets that trip's reminder and a fresh reschedule notice.
+            dedupe_key=f"{kind}:{booking.id}:{booking.trip_id}:{channel}",
+        )
+        for channel, recipient in recipients if recipient
+    ]
+
+
+def queue_for_bookings(bookings, kind):
+    notifications = [n for booking in bookings for n in build_notifications(booking, kind)]
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True, batch_size=500)
+    return len(notifications)
+
+
+def schedule_departure_reminders(window=REMINDER_WINDOW):
+    """
+    Queue reminders for every active booking on a trip departing within
+    `window`. Uses the Trip.departure_time index; re-running is a no-op
+    thanks to dedupe_key.
+    """
+    now = timezone.now()
+    bookings = (Booking.objects
+                .filter(trip__departure_time__gt=now, trip__departure_time__lte=now + window,
+                        trip__active=True, status__in=ACTIVE_BOOKING_STATUSES)
+                .select_related('customer', 'trip')
+                .only('id', 'seat_number', 'customer__id', 'customer__email', 'customer__phone_number',
+                      'trip__origin', 'trip__destination', 'trip__departure_time'))
+    queued, chunk = 0, []
+    for booking in bookings.iterator(chunk_size=1000):
+        chunk.append(booking)
+        if len(chunk) == 1000:
+            queued += queue_for_bookings(chunk, Notification.Kinds.REMINDER)
+            chunk = []
+    return queued + queue_for_bookings(chunk, Notification.Kinds.REMINDER)
+
+
+def claim_due(channel, limit):
+    """
+    Lock a batch of due notifications with SKIP LOCKED and push their
+    next_attempt_at forward so other workers leave them alone while
+    this one is talking to the provider.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(Notification.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(status=Notification.Statuses.PENDING, channel=channel, next_attempt_at__lte=now)
+                     .order_by('next_attempt_at')[:limit])
+        Notification.objects.filter(id__in=[n.id for n in batch]).update(
+            next_attempt_at=now + CLAIM_TIMEOUT, attempts=F('attempts') + 1,
+        )
+    for n in batch:
+        n.attempts += 1
+    return batch
+
+
+def dispatch(channel):
+    """Send one rate-limited batch for `channel`; returns (sent, failed)."""
+    provider = get_provider(channel)
+    batch = claim_due(channel, provider.batch_size)
+    if not batch:
+        return 0, 0
+
+    provider.throttle(len(batch))
+    try:
+        results = provider.backend.send_messages(batch)
+    except Exception as exc:
+        results = [repr(exc)] * len(batch)
+
+    now = timezone.now()
+    sent = [n.id for n, error in zip(batch, results) if error is None]
+    Notification.objects.filter(id__in=sent).update(status=Notification.Statuses.SENT, sent_at=now, last_error="")
+    retries = []
+    for n, error in zip(batch, results):
+        if error is None:
+            continue
+        n.last_error = error
+        if n.attempts >= MAX_ATTEMPTS:
+            n.status = Notification.Statuses.FAILED
+        else:
+            n.next_attempt_at = now + backoff(n.attempts)
+        retries.append(n)
+    Notification.objects.bulk_update(retries, ['status', 'next_attempt_at', 'last_error'])
+    return len(sent), len(retries)
+
+
+def _bookings_for(events):
+    ids = [e.payload['booking_id'] for e in events]
+    return Booking.objects.filter(id__in=ids).select_related('customer', 'trip')
+
+
+@handles("booking.paid")
+def queue_confirmations(events):
+    queue_for_bookings(_bookings_for(events), Notification.Kinds.CONFIRMATION)
+
+
+def withdraw_reminders(booking_trips):
+    """
+    Cancel PENDING reminders for (booking_id, trip_id) pairs, so a customer
+    is not reminded about a trip they are no longer on. Returns the number
+    withdrawn.
+    """
+    keys = [f"{Notification.Kinds.REMINDER}:{booking_id}:{trip_id}:{channel}"
+            for booking_id, trip_id in booking_trips for channel in Notification.Channels.values]
+    return Notification.objects.filter(dedupe_key__in=keys, status=Notification.Statuses.PENDING).update(
+        status=Notification.Statuses.CANCELED,
+    )
+
+
+@handles("booking.canceled")
+def queue_cancellations(events):
+    bookings = list(_bookings_for(events))
+    withdraw_reminders([(b.id, b.trip_id) for b in bookings])
+    queue_for_bookings(bookings, Notification.Kinds.CANCELLATION)
+
+
+@handles("booking.rescheduled")
+def queue_reschedule_notices(events):
+    withdraw_reminders([(e.payload['booking_id'], e.payload['from_trip_id']) for e in events])
+    queue_for_bookings(_bookings_for(events), Notification.Kinds.RESCHEDULE)
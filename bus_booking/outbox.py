@@ -0,0 +1,124 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import OutboxEvent, OutboxOffset, Loyalty
+
+MAX_ATTEMPTS = 5
+# The outbox is one competing-consumer queue: every worker claims from the
+# same pending pool and every registered handler runs once per event.
+# OutboxOffset keeps a single row of progress statistics under this name.
+OFFSET_NAME = "default"
+
+_handlers = defaultdict(list)
+
+
+def publish(topic, **payload):
+    """
+    Record an event in the outbox. Call inside the same transaction.atomic()
+    block as the state change so the event exists if and only if it commits.
+    """
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def publish_many(topic, payloads):
+    """Bulk version of publish() for set-based operations."""
+    return OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, payload=payload) for payload in payloads], batch_size=500,
+    )
+
+
+def handles(*topics):
+    """
+    Register a batch handler. It is called with a list of OutboxEvent
+    rows sharing one topic and must process them all or raise.
+    """
+    def register(func):
+        for topic in topics:
+            _handlers[topic].append(func)
+        return func
+    return register
+
+
+def process_batch(batch_size=100):
+    """
+    Claim up to batch_size pending events with SKIP LOCKED, run their handlers
+    grouped by topic and record progress in OutboxOffset. Returns the number
+    of events marked processed. Several workers may run at once; they share
+    the work rather than each seeing every event.
+    """
+    with transaction.atomic():
+        events = list(OutboxEvent.objects
+                      .select_for_update(skip_locked=True)
+                      .filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+                      .order_by('id')[:batch_size])
+        if not events:
+            return 0
+
+        by_topic = defaultdict(list)
+        for event in events:
+            by_topic[event.topic].append(event)
+
+        done, failed = [], []
+        for topic, group in by_topic.items():
+            try:
+                run_handlers(topic, group)
+                done += [e.id for e in group]
+            except Exception:
+                # Retry one at a time so only the failing events are charged an attempt.
+                for event in group:
+                    try:
+                        run_handlers(topic, [event])
+                        done.append(event.id)
+                    except Exception as exc:
+                        failed.append(([event.id], repr(exc)))
+
+        now = timezone.now()
+        OutboxEvent.objects.filter(id__in=done).update(processed_at=now, attempts=F('attempts') + 1)
+        for ids, error in failed:
+            OutboxEvent.objects.filter(id__in=ids).update(attempts=F('attempts') + 1, last_error=error)
+
+        if done:
+            # last_event_id is a high-water mark only; with several workers
+            # claiming batches lower ids may still be pending, see lag().
+            offset, _ = OutboxOffset.objects.select_for_update().get_or_create(consumer=OFFSET_NAME)
+            offset.last_event_id = max(offset.last_event_id, max(done))
+            offset.processed_count += len(done)
+            offset.save()
+        return len(done)
+
+
+def run_handlers(topic, events):
+    with transaction.atomic():
+        for handler in _handlers.get(topic, []):
+            handler(events)
+
+
+def pending_count():
+    return OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS).count()
+
+
+def lag():
+    """Age of the oldest unprocessed event, as a timedelta (zero when caught up)."""
+    oldest = (OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+              .aggregate(oldest=Min('created_at'))['oldest'])
+    return timezone.now() - oldest if oldest else timedelta(0)
+
+
+@handles("booking.paid")
+def credit_loyalty_points(events):
+    """Credit loyalty points for paid bookings, one UPDATE per customer."""
+    points = defaultdict(int)
+    for event in events:
+        points[event.payload['customer_id']] += event.payload.get('loyalty_points', 0)
+
+    Loyalty.objects.bulk_create(
+        [Loyalty(customer_id=customer_id) for customer_id in points],
+        ignore_conflicts=True,
+    )
+    for customer_id, amount in points.items():
+        if amount:
+            Loyalty.objects.filter(customer_id=customer_id).update(points=F('points') + amount)
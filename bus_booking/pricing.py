@@ -0,0 +1,196 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Trip, Booking, RoutePrice, Location, ACTIVE_BOOKING_STATUSES
+
+QUOTE_KEY = "fare:quotes:{}"
+QUOTE_SHARDS = 256
+ROUTE_MATRIX_KEY = "fare:route-matrix"
+ROUTE_MATRIX_BY_ID_KEY = "fare:route-matrix:ids"
+QUOTE_TIMEOUT = 60 * 30
+# Bounds how long a missed invalidation can serve old base prices.
+ROUTE_MATRIX_TIMEOUT = 60 * 10
+
+# (hours before departure, multiplier), checked in order; the first bound
+# the trip falls under wins.
+LEAD_TIME_RULES = [
+    (6, 1.25),
+    (24, 1.15),
+    (72, 1.05),
+    (24 * 14, 1.00),
+    (float('inf'), 0.90),
+]
+# Monday=0 .. Sunday=6
+WEEKDAY_MULTIPLIERS = [1.00, 1.00, 1.00, 1.00, 1.10, 1.05, 1.10]
+# Fares rise linearly from 1.0 at OCCUPANCY_FLOOR load to OCCUPANCY_MAX_MULTIPLIER when full.
+OCCUPANCY_FLOOR = 0.5
+OCCUPANCY_MAX_MULTIPLIER = 1.30
+
+# Sent with trip_ids=[...] when reprice_upcoming_trips() changes cached fares.
+quotes_changed = Signal()
+
+
+def route_prices():
+    """
+    {(origin name, destination name): base price} for every RoutePrice,
+    cached as one object so lookups are a dict access.
+    """
+    matrix = cache.get(ROUTE_MATRIX_KEY)
+    if matrix is None:
+        matrix = {
+            (origin, destination): price
+            for origin, destination, price in RoutePrice.objects.values_list('origin__name', 'destination__name', 'price')
+        }
+        cache.set(ROUTE_MATRIX_KEY, matrix, ROUTE_MATRIX_TIMEOUT)
+    return matrix
+
+
+def route_prices_by_id():
+    """Same as route_prices() but keyed by (origin_id, destination_id)."""
+    matrix = cache.get(ROUTE_MATRIX_BY_ID_KEY)
+    if matrix is None:
+        matrix = {
+            (origin, destination): price
+            for origin, destination, price in RoutePrice.objects.values_list('origin_id', 'destination_id', 'price')
+        }
+        cache.set(ROUTE_MATRIX_BY_ID_KEY, matrix, ROUTE_MATRIX_TIMEOUT)
+    return matrix
+
+
+def compute_fares(bases, hours_left, load_factors, weekdays):
+    """
+    Apply the lead-time, occupancy and weekday rules to parallel lists and
+    return whole-shilling fares. Pure arithmetic over flat lists so tens of
+    thousands of trips price in a few milliseconds.
+    """
+    lead = []
+    for hours in hours_left:
+        for bound, multiplier in LEAD_TIME_RULES:
+            if hours < bound:
+                lead.append(multiplier)
+                break
+
+    span = 1.0 - OCCUPANCY_FLOOR
+    uplift = OCCUPANCY_MAX_MULTIPLIER - 1.0
+    return [
+        round(base * lm * (1.0 + uplift * max(load - OCCUPANCY_FLOOR, 0.0) / span) * WEEKDAY_MULTIPLIERS[day])
+        for base, lm, load, day in zip(bases, lead, load_factors, weekdays)
+    ]
+
+
+def price_trips(rows, now=None):
+    """
+    {trip_id: fare} for rows of (trip_id, origin, destination, departure,
+    trip price, total seats, seats taken). The RoutePrice base wins over the
+    trip's own price when one exists.
+    """
+    now = now or timezone.now()
+    matrix = route_prices()
+    tz = timezone.get_current_timezone()
+    ids, bases, hours_left, load_factors, weekdays = [], [], [], [], []
+    for trip_id, origin, destination, departure, price, seats, taken in rows:
+        ids.append(trip_id)
+        bases.append(float(matrix.get((origin, destination), price)))
+        hours_left.append(max((departure - now).total_seconds() / 3600, 0.0))
+        load_factors.append(taken / seats if seats else 1.0)
+        weekdays.append(departure.astimezone(tz).weekday())
+    return dict(zip(ids, compute_fares(bases, hours_left, load_factors, weekdays)))
+
+
+def shard_key(trip_id):
+    return QUOTE_KEY.format(trip_id % QUOTE_SHARDS)
+
+
+def reprice_upcoming_trips():
+    """
+    Recompute the quote for every upcoming active trip with two queries and
+    store them all with a single cache.set_many(). Sends quotes_changed for
+    the trips whose fare moved. Returns the number priced.
+    """
+    now = timezone.now()
+    trips = list(Trip.objects
+                 .filter(active=True, departure_time__gt=now)
+                 .values_list('id', 'origin', 'destination', 'departure_time', 'price', 'bus__total_seats'))
+    if not trips:
+        return 0
+
+    taken = dict(Booking.objects
+                 .filter(trip__active=True, trip__departure_time__gt=now, status__in=ACTIVE_BOOKING_STATUSES)
+                 .values('trip').annotate(n=Count('id')).values_list('trip', 'n'))
+    fares = price_trips([(*trip, taken.get(trip[0], 0)) for trip in trips], now)
+
+    shards = {}
+    for trip_id, fare in fares.items():
+        shards.setdefault(shard_key(trip_id), {})[trip_id] = fare
+    previous = cache.get_many(shards)
+    cache.set_many(shards, QUOTE_TIMEOUT)
+    changed = [trip_id for trip_id, fare in fares.items() if previous.get(shard_key(trip_id), {}).get(trip_id) != fare]
+    if changed:
+        quotes_changed.send(sender=Trip, trip_ids=changed)
+    return len(fares)
+
+
+def quote_trip(trip):
+    """Price a single trip from scratch and cache the result."""
+    taken = Booking.objects.filter(trip=trip, status__in=ACTIVE_BOOKING_STATUSES).count()
+    fare = price_trips([(trip.pk, trip.origin, trip.destination, trip.departure_time, trip.price,
+                         trip.bus.total_seats, taken)])[trip.pk]
+    key = shard_key(trip.pk)
+    shard = cache.get(key) or {}
+    shard[trip.pk] = fare
+    cache.set(key, shard, QUOTE_TIMEOUT)
+    return Decimal(fare)
+
+
+def get_quote(trip):
+    """
+    The current fare for `trip`. Quotes live in QUOTE_SHARDS small dicts
+    keyed by trip id, so a lookup is one cache get plus a dict access;
+    a miss reprices just this trip.
+    """
+    fare = (cache.get(shard_key(trip.pk)) or {}).get(trip.pk)
+    return Decimal(fare) if fare is not None else quote_trip(trip)
+
+
+def get_quotes(rows):
+    """
+    Bulk get_quote(): {trip_id: fare} for rows shaped as in price_trips().
+    One cache.get_many() for the cached quotes; misses are priced together
+    and cached, so every caller sees the fare payment_page charges.
+    """
+    shards = cache.get_many({shard_key(row[0]) for row in rows})
+    quotes, missing = {}, []
+    for row in rows:
+        fare = shards.get(shard_key(row[0]), {}).get(row[0])
+        if fare is None:
+            missing.append(row)
+        else:
+            quotes[row[0]] = fare
+    if missing:
+        fresh = price_trips(missing)
+        updated = {}
+        for trip_id, fare in fresh.items():
+            key = shard_key(trip_id)
+            updated.setdefault(key, shards.get(key, {}))[trip_id] = fare
+        cache.set_many(updated, QUOTE_TIMEOUT)
+        quotes.update(fresh)
+    return quotes
+
+
+@receiver([post_save, post_delete], sender=RoutePrice)
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_route_prices(sender, **kwargs):
+    cache.delete_many([ROUTE_MATRIX_KEY, ROUTE_MATRIX_BY_ID_KEY])
+
+
+@receiver(post_save, sender=Trip)
+def invalidate_trip_quote(sender, instance, **kwargs):
+    key = shard_key(instance.pk)
+    shard = cache.get(key)
+    if shard and shard.pop(instance.pk, None) is not None:
+        cache.set(key, shard, QUOTE_TIMEOUT)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/m' -> (30, 60)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period[:1]]
+
+
+class LocalBackend:
+    """
+    In-process token buckets. Exact and lock-protected, but each worker
+    process keeps its own buckets, so limits are per process: use on a
+    single node, or divide the configured rates by the worker count.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    def hit(self, key, limit, period):
+        """Take one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        rate = limit / period
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                retry = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                retry = (1 - tokens) / rate
+            if now - self.last_sweep > 60:
+                self.sweep(now)
+        return retry
+
+    def sweep(self, now):
+        # Drop buckets idle long enough to have refilled completely.
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < 3600}
+        self.last_sweep = now
+
+
+class CacheBackend:
+    """
+    Sliding-window counters in a shared cache (Redis/memcached in
+    production), so the limit holds across processes and nodes. Each hit
+    is one atomic cache.incr() on the current window plus a read of the
+    previous one; the previous window's count is weighted by how much of
+    it still overlaps the sliding window.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        current_key = f"rl:{key}:{window}"
+        self.cache.add(current_key, 0, period * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:  # expired between add() and incr()
+            self.cache.set(current_key, 1, period * 2)
+            current = 1
+        previous = self.cache.get(f"rl:{key}:{window - 1}", 0)
+        elapsed = now - window * period
+        estimated = previous * (1 - elapsed / period) + current
+        if estimated <= limit:
+            return 0
+        return max(period - elapsed, 1)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'RATE_LIMIT_BACKEND', 'cache')
+        _backend = LocalBackend() if name == 'local' else CacheBackend(getattr(settings, 'RATE_LIMIT_CACHE', 'default'))
+    return _backend
+
+
+def rules_for(url_name, method):
+    """The configured rules for a URL name that apply to this HTTP method."""
+    return [
+        rule for rule in getattr(settings, 'RATE_LIMITS', {}).get(url_name, ())
+        if method in rule.get('methods', (method,))
+    ]
@@ -0,0 +1,43 @@
+"""
+PDF receipts. ReportLab is slow to import, so views import this module
+inside download_receipt rather than at module load.
+"""
+from io import BytesIO
+
+from django.contrib.staticfiles import finders
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
+
+RECEIPT_LOGO = 'bus_booking/img/logo.jpg'
+
+
+def build_receipt_pdf(booking):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    logo_path = finders.find(RECEIPT_LOGO)
+    if logo_path:
+        elements += [RLImage(logo_path, width=100, height=88), Spacer(1,12)]
+
+    elements.append(Paragraph("QuickTransit Receipt", styles['Title']))
+    elements.append(Spacer(1,12))
+    data = [["Field","Value"],["Customer",booking.customer.username],
+            ["Trip",str(booking.trip)],["Seat",booking.seat_number],
+            ["Status",booking.status],["Date",booking.booking_date.strftime("%Y-%m-%d %H:%M:%S")],
+            ["Points",booking.loyalty_points]]
+    table = Table(data, colWidths=[150,300])
+    table.setStyle(TableStyle([
+        ('BACKGROUND',(0,0),(-1,0),colors.grey),
+        ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
+        ('ALIGN',(0,0),(-1,-1),'LEFT'),
+        ('GRID',(0,0),(-1,-1),1,colors.black)
+    ]))
+    elements += [table, Spacer(1,12), Paragraph("Thank you!",styles['Normal'])]
+    doc.build(elements)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
@@ -0,0 +1,43 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip variants are always written.
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes .gz (and .br when the brotli package is
+    installed) next to every hashed text asset during collectstatic, so the
+    server can send pre-compressed files without compressing per request.
+    """
+    compressible_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml', '.html')
+    min_compress_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if isinstance(hashed_name, str):
+                hashed.append(hashed_name)
+            yield name, hashed_name, processed
+        if not dry_run:
+            for name in set(hashed):
+                self.compress(name)
+
+    def compress(self, name):
+        if not name.endswith(self.compressible_extensions):
+            return
+        with self.open(name) as fh:
+            data = fh.read()
+        if len(data) < self.min_compress_size:
+            return
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(data):
+                with open(self.path(name + suffix), 'wb') as fh:
+                    fh.write(compressed)
@@ -1,3 +1,861 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
- 
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import journeys, notifications, outbox, pricing, ratelimit, timetable, waitlist
+from .disruptions import DISRUPTION_BONUS_POINTS, DisruptionError, transfer_bookings
+from .journeys import JourneyIndex, Leg
+from .management.commands import seed_data
+from .middleware import IMMUTABLE, REVALIDATE, StaticFilesMiddleware
+from .models import (
+    Booking, Bus, Location, Loyalty, Notification, OutboxEvent, OutboxOffset, RoutePrice, TicketSale, Trip, User,
+    WaitlistEntry,
+)
+from .storage import CompressedManifestStaticFilesStorage
+from .templatetags.booking_urls import with_id
+from .views import HISTORY_MAX_PAGE_SIZE, IdURL, dashboard_urls, decode_history_cursor, encode_history_cursor
+
+
+def make_trip(seats=4, hours=24, **kwargs):
+    bus = Bus.objects.create(bus="KBX 100", origin="Nairobi", destination="Mombasa",
+                             departure_time=timezone.now(), price=1000, total_seats=seats)
+    return Trip.objects.create(bus=bus, origin="Nairobi", destination="Mombasa",
+                               departure_time=timezone.now() + timedelta(hours=hours), price=1000, **kwargs)
+
+
+def make_customers(count, prefix="customer"):
+    return [User.objects.create_user(f"{prefix}{i}") for i in range(count)]
+
+
+def reset_rate_limits(test):
+    ratelimit._backend = None
+    test.addCleanup(setattr, ratelimit, '_backend', None)
+
+
+def fill(trip, customers):
+    """Book one seat per customer on `trip`, in seat order."""
+    return [Booking.objects.create(customer=customer, trip=trip, seat_number=seat)
+            for customer, seat in zip(customers, trip.bus.seat_labels())]
+
+
+
+class BookingHistoryTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user("rider")
+        trip = make_trip(seats=40)
+        self.bookings = [Booking.objects.create(customer=self.customer, trip=trip, seat_number=seat)
+                         for seat in trip.bus.seat_labels()[:5]]
+        # Two bookings made in the same instant must still page by id.
+        Booking.objects.filter(id__in=[b.id for b in self.bookings[1:3]]).update(
+            booking_date=self.bookings[1].booking_date)
+        self.client.force_login(self.customer)
+
+    def history(self, **params):
+        return self.client.get(reverse('booking_history_api'), params)
+
+    def test_cursor_round_trip(self):
+        booking = self.bookings[0]
+        self.assertEqual(decode_history_cursor(encode_history_cursor(booking)), (booking.booking_date, booking.id))
+
+    def test_bad_cursors_are_rejected(self):
+        for cursor in ("", "not-base64!", "bm9waXBl", encode_history_cursor(self.bookings[0])[:-3]):
+            self.assertIsNone(decode_history_cursor(cursor), cursor)
+        response = self.history(cursor='bm9waXBl')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': "Invalid cursor"})
+        self.assertEqual(self.history(filter='soon').status_code, 400)
+        self.assertEqual(self.history(limit='ten').status_code, 400)
+
+    def test_pages_cover_every_booking_once(self):
+        seen, cursor = [], None
+        while True:
+            data = self.history(limit=2, **({'cursor': cursor} if cursor else {})).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [b.id for b in sorted(self.bookings, key=lambda b: (b.booking_date, b.id), reverse=True)])
+
+    def test_page_size_is_capped(self):
+        trip = make_trip(seats=200)
+        for seat in trip.bus.seat_labels()[:HISTORY_MAX_PAGE_SIZE + 5]:
+            Booking.objects.create(customer=self.customer, trip=trip, seat_number=seat)
+        data = self.history(limit=1000).json()
+        self.assertEqual(len(data['results']), HISTORY_MAX_PAGE_SIZE)
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_query_count_is_constant_per_page(self):
+        # Every booking on its own trip and bus, so a per-row trip or bus
+        # lookup would show up as extra queries.
+        for _ in range(6):
+            trip = make_trip(seats=4)
+            Booking.objects.create(customer=self.customer, trip=trip, seat_number="1A")
+
+        with CaptureQueriesContext(connection) as first:
+            cursor = self.history(limit=2).json()['next_cursor']
+        with self.assertNumQueries(len(first)):
+            data = self.history(limit=8, cursor=cursor).json()
+        self.assertEqual(len(data['results']), 8)
+        with self.assertNumQueries(len(first)):
+            self.client.get(reverse('booking_history'), {'limit': 8, 'cursor': cursor})
+
+    def test_filters(self):
+        past = Booking.objects.create(customer=self.customer, trip=make_trip(hours=-24), seat_number="1A")
+        canceled = self.bookings[0]
+        canceled.status = "CANCELED"
+        canceled.save()
+
+        def ids(name):
+            return {row['id'] for row in self.history(filter=name).json()['results']}
+
+        self.assertEqual(ids('upcoming'), {b.id for b in self.bookings[1:]})
+        self.assertEqual(ids('past'), {past.id})
+        self.assertEqual(ids('canceled'), {canceled.id})
+
+    def test_history_rows_keep_booking_actions(self):
+        response = self.client.get(reverse('booking_history'), {'filter': 'upcoming'})
+        booking = self.bookings[0]
+        for name in ('cancel_booking', 'reschedule_booking', 'download_receipt'):
+            self.assertContains(response, reverse(name, args=[booking.id]))
+
+
+class OutboxTests(TestCase):
+    topic = "test.poison"
+
+    def setUp(self):
+        self.handled = []
+
+        @outbox.handles(self.topic)
+        def handler(events):
+            if any(event.payload.get('poison') for event in events):
+                raise RuntimeError("bad event")
+            self.handled += [event.id for event in events]
+
+        self.handler = handler
+
+    def tearDown(self):
+        outbox._handlers[self.topic].remove(self.handler)
+
+    def test_poison_event_does_not_hold_back_its_group(self):
+        good = [outbox.publish(self.topic, n=n) for n in range(3)]
+        bad = outbox.publish(self.topic, poison=True)
+
+        self.assertEqual(outbox.process_batch(), 3)
+        self.assertEqual(sorted(self.handled), [e.id for e in good])
+        bad.refresh_from_db()
+        self.assertIsNone(bad.processed_at)
+        self.assertEqual(bad.attempts, 1)
+        self.assertIn("bad event", bad.last_error)
+        for event in good:
+            event.refresh_from_db()
+            self.assertIsNotNone(event.processed_at)
+            self.assertEqual(event.attempts, 1)
+
+    def test_poison_event_is_abandoned_after_max_attempts(self):
+        bad = outbox.publish(self.topic, poison=True)
+        for _ in range(outbox.MAX_ATTEMPTS + 2):
+            outbox.process_batch()
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(outbox.pending_count(), 0)
+
+    def test_lag_tracks_oldest_pending_event(self):
+        self.assertEqual(outbox.lag(), timedelta(0))
+        event = outbox.publish(self.topic, n=1)
+        OutboxEvent.objects.filter(id=event.id).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertGreaterEqual(outbox.lag(), timedelta(minutes=5))
+        outbox.process_batch()
+        self.assertEqual(outbox.lag(), timedelta(0))
+
+    def test_events_are_processed_once_and_counted(self):
+        events = [outbox.publish(self.topic, n=n) for n in range(5)]
+        self.assertEqual(outbox.process_batch(batch_size=2), 2)
+        self.assertEqual(outbox.process_batch(), 3)
+        self.assertEqual(outbox.process_batch(), 0)
+        self.assertEqual(sorted(self.handled), [e.id for e in events])
+        offset = OutboxOffset.objects.get(consumer=outbox.OFFSET_NAME)
+        self.assertEqual((offset.last_event_id, offset.processed_count), (events[-1].id, 5))
+
+    def test_event_is_written_with_the_state_change(self):
+        customer = User.objects.create_user("rider")
+        booking = Booking.objects.create(customer=customer, trip=make_trip(), seat_number="1A")
+        self.client.force_login(customer)
+        self.client.get(reverse('cancel_booking', args=[booking.id]))
+        event = OutboxEvent.objects.get(topic="booking.canceled")
+        self.assertEqual(event.payload, {'booking_id': booking.id, 'customer_id': customer.id, 'trip_id': booking.trip_id})
+
+
+
+class FakeClock:
+    now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FlakyBackend(notifications.BaseBackend):
+    """Rejects messages to recipients listed in OPTIONS['fail']."""
+    sent = []
+
+    def send_messages(self, batch):
+        FlakyBackend.sent += [n.recipient for n in batch]
+        return ["provider error" if n.recipient in self.options['fail'] else None for n in batch]
+
+
+@override_settings(
+    RATE_LIMIT_BACKEND='local',
+    NOTIFICATION_PROVIDERS={
+        'SMS': {'BACKEND': 'bus_booking.tests.FlakyBackend', 'RATE_PER_SECOND': 1000, 'BATCH_SIZE': 10,
+                'OPTIONS': {'fail': ["+254700000002"]}},
+        'EMAIL': {'BACKEND': 'bus_booking.tests.FlakyBackend', 'RATE_PER_SECOND': 1000, 'BATCH_SIZE': 10,
+                  'OPTIONS': {'fail': []}},
+    },
+)
+class NotificationTests(TestCase):
+    def setUp(self):
+        reset_rate_limits(self)
+        notifications._providers.clear()
+        self.addCleanup(notifications._providers.clear)
+        FlakyBackend.sent = []
+        self.trip = make_trip(hours=6)
+        self.later = make_trip(hours=48)
+        self.customers = [User.objects.create_user(f"rider{i}", email=f"rider{i}@example.com",
+                                                   phone_number=f"+25470000000{i}") for i in (1, 2)]
+        self.bookings = fill(self.trip, self.customers)
+
+    def reminders(self, booking):
+        return Notification.objects.filter(booking=booking, kind=Notification.Kinds.REMINDER)
+
+    def test_reminders_are_queued_once_per_channel(self):
+        Booking.objects.create(customer=self.customers[0], trip=self.later, seat_number="1A")
+        self.assertEqual(notifications.schedule_departure_reminders(), 4)
+        notifications.schedule_departure_reminders()
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertEqual({n.booking_id for n in Notification.objects.all()}, {b.id for b in self.bookings})
+        self.assertEqual(sorted(self.reminders(self.bookings[0]).values_list('recipient', flat=True)),
+                         ["+254700000001", "rider1@example.com"])
+
+    def test_failed_sends_back_off_then_give_up(self):
+        notifications.schedule_departure_reminders()
+        self.assertEqual(notifications.dispatch(Notification.Channels.SMS), (1, 1))
+        self.assertEqual(notifications.dispatch(Notification.Channels.EMAIL), (2, 0))
+
+        failing = Notification.objects.get(recipient="+254700000002")
+        self.assertEqual((failing.status, failing.attempts, failing.last_error),
+                         (Notification.Statuses.PENDING, 1, "provider error"))
+        self.assertAlmostEqual((failing.next_attempt_at - timezone.now()).total_seconds(),
+                               notifications.BACKOFF_BASE.total_seconds(), delta=5)
+        self.assertEqual(notifications.dispatch(Notification.Channels.SMS), (0, 0))  # not due yet
+
+        for attempt in range(2, notifications.MAX_ATTEMPTS + 1):
+            Notification.objects.filter(id=failing.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(notifications.dispatch(Notification.Channels.SMS), (0, 1))
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Notification.Statuses.FAILED, notifications.MAX_ATTEMPTS))
+        self.assertEqual(Notification.objects.filter(status=Notification.Statuses.SENT).count(), 3)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([notifications.backoff(n).total_seconds() for n in (1, 2, 3)], [30, 60, 120])
+        self.assertEqual(notifications.backoff(20), notifications.BACKOFF_CAP)
+
+    def test_sends_wait_for_the_rate_limit(self):
+        provider = notifications.Provider("SMS", {'BACKEND': 'bus_booking.tests.FlakyBackend', 'RATE_PER_SECOND': 5})
+        clock = FakeClock()
+        with mock.patch('bus_booking.ratelimit.time', clock), mock.patch('bus_booking.notifications.time', clock):
+            provider.throttle(5)
+            self.assertEqual(clock.now, 0)
+            provider.throttle(3)
+        self.assertAlmostEqual(clock.now, 0.6)
+
+    def test_cancel_and_reschedule_withdraw_old_reminders(self):
+        notifications.schedule_departure_reminders()
+        canceled, moved = self.bookings
+        outbox.publish("booking.canceled", booking_id=canceled.id, customer_id=canceled.customer_id, trip_id=self.trip.id)
+        Booking.objects.filter(id=canceled.id).update(status="CANCELED")
+        Booking.objects.filter(id=moved.id).update(trip=self.later, status="RESCHEDULED")
+        outbox.publish("booking.rescheduled", booking_id=moved.id, customer_id=moved.customer_id,
+                       from_trip_id=self.trip.id, to_trip_id=self.later.id)
+        outbox.process_batch()
+
+        for booking in self.bookings:
+            self.assertEqual(set(self.reminders(booking).values_list('status', flat=True)),
+                             {Notification.Statuses.CANCELED})
+        kinds = set(Notification.objects.filter(status=Notification.Statuses.PENDING).values_list('kind', 'booking_id'))
+        self.assertEqual(kinds, {(Notification.Kinds.CANCELLATION, canceled.id), (Notification.Kinds.RESCHEDULE, moved.id)})
+
+        # The moved booking is reminded about its new trip when that one is due.
+        notifications.schedule_departure_reminders(window=timedelta(days=3))
+        self.assertEqual(self.reminders(moved).filter(status=Notification.Statuses.PENDING).count(), 2)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        nairobi, mombasa = Location.objects.create(name="Nairobi"), Location.objects.create(name="Mombasa")
+        self.route = RoutePrice.objects.create(origin=nairobi, destination=mombasa, price=1200)
+        self.trip = make_trip(seats=4, hours=100)
+        self.weekday = pricing.WEEKDAY_MULTIPLIERS[timezone.localtime(self.trip.departure_time).weekday()]
+
+    def test_compute_fares_rules(self):
+        monday, friday = 0, 4
+        self.assertEqual(pricing.compute_fares(
+            [1000] * 6,
+            [100, 5, 30, 1000, 100, 5],
+            [0.0, 0.0, 0.0, 0.0, 1.0, 0.75],
+            [monday, monday, monday, monday, monday, friday],
+        ), [1000, 1250, 1050, 900, 1300, 1581])
+
+    def test_quote_uses_route_base_and_occupancy(self):
+        self.assertEqual(pricing.get_quote(self.trip), Decimal(round(1200 * self.weekday)))
+        fill(self.trip, make_customers(4))
+        self.assertEqual(pricing.reprice_upcoming_trips(), 1)
+        self.assertEqual(pricing.get_quote(self.trip), Decimal(round(1200 * 1.3 * self.weekday)))
+
+    def test_quotes_are_served_from_the_cache(self):
+        make_trip(hours=50)
+        pricing.reprice_upcoming_trips()
+        with self.assertNumQueries(0):
+            pricing.get_quote(self.trip)
+        response = self.client.get(reverse('get_trip_price'), {'trip_id': self.trip.id})
+        self.assertEqual(response.json(), {'price': str(Decimal(round(1200 * self.weekday)))})
+
+    def test_route_price_change_invalidates_matrix_and_quote(self):
+        pricing.get_quote(self.trip)
+        self.route.price = 2000
+        self.route.save()
+        self.trip.save()
+        self.assertEqual(pricing.route_prices()[("Nairobi", "Mombasa")], 2000)
+        self.assertEqual(pricing.get_quote(self.trip), Decimal(round(2000 * self.weekday)))
+
+
+class JourneySearchTests(SimpleTestCase):
+    def brute_force(self, index, origin, destination, depart_after, optimize, max_legs):
+        """Best key over every valid path, found by exhaustive search."""
+        connection, wait = journeys.MIN_CONNECTION.total_seconds(), journeys.MAX_WAIT.total_seconds()
+        best = None
+
+        def walk(leg, cost, used):
+            nonlocal best
+            if leg.destination == destination:
+                key = (cost, leg.arrival) if optimize == "price" else (leg.arrival, cost)
+                best = key if best is None or key < best else best
+                return
+            if used == max_legs or leg.destination == origin:
+                return
+            for nxt in index.departures(leg.destination, leg.arrival + connection, wait):
+                walk(nxt, cost + nxt.price, used + 1)
+
+        for leg in index.departures(origin, depart_after, journeys.FIRST_LEG_WINDOW.total_seconds()):
+            walk(leg, leg.price, 1)
+        return best
+
+    def key(self, path, optimize):
+        cost = sum(leg.price for leg in path)
+        return (cost, path[-1].arrival) if optimize == "price" else (path[-1].arrival, cost)
+
+    def test_costlier_path_with_fewer_legs_is_not_pruned(self):
+        hour = 3600
+        index = JourneyIndex([
+            Leg(0, 5 * hour, "A", "B", 10.0, 1),
+            Leg(0, 1 * hour, "A", "X", 1.0, 2),
+            Leg(2 * hour, 3 * hour, "X", "B", 1.0, 3),
+            Leg(6 * hour, 7 * hour, "B", "D", 1.0, 4),
+            Leg(8 * hour, 9 * hour, "D", "C", 1.0, 5),
+        ])
+        for optimize in ("price", "arrival"):
+            path = index.search("A", "C", 0, optimize, max_legs=3)
+            self.assertEqual([leg.trip_id for leg in path], [1, 4, 5], optimize)
+        self.assertEqual([leg.trip_id for leg in index.search("A", "C", 0, "price", max_legs=4)], [2, 3, 4, 5])
+        self.assertIsNone(index.search("A", "C", 0, "price", max_legs=2))
+
+    def test_connections_respect_minimum_transfer_time(self):
+        index = JourneyIndex([
+            Leg(0, 3600, "A", "B", 100.0, 1),
+            Leg(3600 + 600, 7200, "B", "C", 100.0, 2),   # leaves 10 minutes after arrival
+            Leg(3600 * 3, 3600 * 4, "B", "C", 300.0, 3),
+        ])
+        self.assertEqual([leg.trip_id for leg in index.search("A", "C", 0)], [1, 3])
+        path = index.search("A", "C", 0, min_connection=timedelta(minutes=5))
+        self.assertEqual([leg.trip_id for leg in path], [1, 2])
+
+    def test_matches_exhaustive_search(self):
+        # A sparse network, as in bench_journeys, so routes need several legs.
+        rng = random.Random(1)
+        locations = [f"L{i}" for i in range(20)]
+        neighbours = {loc: rng.sample([n for n in locations if n != loc], 3) for loc in locations}
+        legs = []
+        for trip_id in range(500):
+            origin = rng.choice(locations)
+            destination = rng.choice(neighbours[origin])
+            departure = rng.uniform(0, 3 * 86400)
+            legs.append(Leg(departure, departure + rng.uniform(1, 6) * 3600, origin, destination,
+                            float(rng.randint(1, 20)), trip_id))
+        index = JourneyIndex(legs)
+        for _ in range(150):
+            origin, destination = rng.sample(locations, 2)
+            depart_after = rng.uniform(0, 86400)
+            for optimize in ("arrival", "price"):
+                path = index.search(origin, destination, depart_after, optimize, max_legs=3)
+                expected = self.brute_force(index, origin, destination, depart_after, optimize, 3)
+                self.assertEqual(path and self.key(path, optimize), expected, (origin, destination, optimize))
+                if path:
+                    self.assertLessEqual(len(path), 3)
+
+    def test_incremental_updates(self):
+        index = JourneyIndex([Leg(0, 3600, "A", "B", 100.0, 1)])
+        index.add(Leg(0, 1800, "A", "B", 50.0, 2))
+        self.assertEqual(index.search("A", "B", 0)[0].trip_id, 2)
+        index.remove(2)
+        index.add(Leg(0, 3600, "A", "C", 100.0, 1))
+        self.assertIsNone(index.search("A", "B", 0))
+
+
+class JourneyIndexSyncTests(TestCase):
+    def setUp(self):
+        journeys._index = None
+        self.addCleanup(setattr, journeys, '_index', None)
+
+    def test_index_follows_trip_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            trip = make_trip(hours=5)
+        self.assertEqual([leg.trip_id for leg in journeys.plan_journey("Nairobi", "Mombasa")], [trip.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trip.active = False
+            trip.save()
+        self.assertIsNone(journeys.plan_journey("Nairobi", "Mombasa"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            later = make_trip(hours=24 * 10)
+        self.assertIsNone(journeys.plan_journey("Nairobi", "Mombasa"))
+        path = journeys.plan_journey("Nairobi", "Mombasa", first_leg_window=timedelta(days=14))
+        self.assertEqual([leg.trip_id for leg in path], [later.id])
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.trip = make_trip(seats=4)
+        self.riders = make_customers(4)
+        self.bookings = fill(self.trip, self.riders)
+        self.first, self.second = make_customers(2, prefix="waiting")
+        self.entries = [WaitlistEntry.objects.create(trip=self.trip, customer=c) for c in (self.first, self.second)]
+
+    def cancel(self, booking):
+        booking.status = "CANCELED"
+        booking.save()
+
+    def test_freed_seat_goes_to_longest_waiting_customer(self):
+        self.cancel(self.bookings[0])
+        offers = waitlist.offer_seats([self.trip.id])
+        self.assertEqual([e.customer_id for e in offers], [self.first.id])
+        entry = WaitlistEntry.objects.get(id=self.entries[0].id)
+        self.assertEqual((entry.status, entry.offered_seat), (WaitlistEntry.Statuses.OFFERED, "1A"))
+        self.assertEqual(waitlist.held_seats([self.trip.id])[self.trip.id], {"1A"})
+
+    def test_accepting_goes_through_payment(self):
+        self.cancel(self.bookings[0])
+        waitlist.offer_seats([self.trip.id])
+        self.client.force_login(self.first)
+
+        response = self.client.post(reverse('accept_waitlist_offer', args=[self.entries[0].id]))
+        self.assertRedirects(response, reverse('payment_page', args=[self.trip.id]), fetch_redirect_response=False)
+        response = self.client.post(response.url, {'seat_number': "1A", 'payment_method': "cash"})
+        self.assertRedirects(response, reverse('customer_dashboard'), fetch_redirect_response=False)
+
+        booking = Booking.objects.get(customer=self.first, trip=self.trip)
+        self.assertEqual(booking.status, "PAID")
+        self.assertEqual(WaitlistEntry.objects.get(id=self.entries[0].id).status, WaitlistEntry.Statuses.ACCEPTED)
+        self.assertTrue(OutboxEvent.objects.filter(topic="booking.paid", payload__booking_id=booking.id).exists())
+
+    def test_offer_on_deactivated_trip_cannot_be_accepted(self):
+        self.cancel(self.bookings[0])
+        waitlist.offer_seats([self.trip.id])
+        Trip.objects.filter(id=self.trip.id).update(active=False)
+        self.assertIsNone(waitlist.open_offer(self.entries[0].id, self.first))
+
+    def test_expired_offer_passes_to_next_customer(self):
+        self.cancel(self.bookings[0])
+        waitlist.offer_seats([self.trip.id])
+        WaitlistEntry.objects.filter(id=self.entries[0].id).update(offer_expires_at=timezone.now() - timedelta(seconds=1))
+
+        offers = waitlist.sweep()
+        self.assertEqual([e.customer_id for e in offers], [self.second.id])
+        self.assertEqual(WaitlistEntry.objects.get(id=self.entries[0].id).status, WaitlistEntry.Statuses.EXPIRED)
+        self.assertIsNone(waitlist.open_offer(self.entries[0].id, self.first))
+
+    def test_rescheduled_seat_is_not_sold_twice(self):
+        self.cancel(self.bookings[0])
+        other = make_trip(seats=4, hours=30)
+        moved = Booking.objects.create(customer=self.second, trip=other, seat_number="1A")
+        moved.trip, moved.status = self.trip, "RESCHEDULED"
+        moved.save()
+
+        self.assertEqual(waitlist.free_seats([self.trip])[self.trip.id], [])
+        self.client.force_login(self.first)
+        response = self.client.get(reverse('payment_page', args=[self.trip.id]))
+        self.assertEqual(response.context['available_seats'], [])
+        self.assertContains(response, "This trip is sold out.")
+        self.client.post(reverse('payment_page', args=[self.trip.id]), {'seat_number': "1A", 'payment_method': "cash"})
+        self.assertEqual(Booking.objects.filter(trip=self.trip, seat_number="1A").exclude(status="CANCELED").count(), 1)
+
+
+
+class TransferBookingsTests(TestCase):
+    def setUp(self):
+        self.disrupted = make_trip(seats=8)
+        self.replacement = make_trip(seats=8, hours=26)
+        self.customers = make_customers(4)
+
+    def test_seats_kept_when_free_and_remapped_otherwise(self):
+        moved = fill(self.disrupted, self.customers)             # 1A 1B 1C 1D
+        fill(self.replacement, make_customers(2, prefix="other"))  # 1A 1B taken
+
+        self.assertEqual(transfer_bookings(self.disrupted.id, self.replacement.id), 4)
+
+        seats = dict(Booking.objects.filter(id__in=[b.id for b in moved]).values_list('id', 'seat_number'))
+        self.assertEqual([seats[b.id] for b in moved], ["2A", "2B", "1C", "1D"])
+        self.assertFalse(Booking.objects.filter(trip=self.disrupted).exists())
+        self.disrupted.refresh_from_db()
+        self.assertFalse(self.disrupted.active)
+
+    def test_not_enough_seats_changes_nothing(self):
+        moved = fill(self.disrupted, self.customers)
+        fill(self.replacement, make_customers(6, prefix="other"))
+
+        with self.assertRaises(DisruptionError):
+            transfer_bookings(self.disrupted.id, self.replacement.id)
+        self.assertEqual(Booking.objects.filter(trip=self.disrupted).count(), len(moved))
+        self.disrupted.refresh_from_db()
+        self.assertTrue(self.disrupted.active)
+
+    def test_waitlist_moves_with_the_trip(self):
+        waiting = make_customers(1, prefix="waiting")[0]
+        entry = WaitlistEntry.objects.create(trip=self.disrupted, customer=waiting)
+        transfer_bookings(self.disrupted.id, self.replacement.id)
+        entry.refresh_from_db()
+        self.assertEqual(entry.trip_id, self.replacement.id)
+        self.assertEqual(entry.status, WaitlistEntry.Statuses.OFFERED)
+
+    def test_only_moved_bookings_take_their_sales_and_points(self):
+        moved = fill(self.disrupted, self.customers[:2])
+        canceled = Booking.objects.create(customer=self.customers[2], trip=self.disrupted, seat_number="2A",
+                                          status="CANCELED")
+        for booking in moved + [canceled]:
+            TicketSale.objects.create(bus=self.disrupted.bus, trip=self.disrupted, booking=booking, amount=1000)
+        unlinked = TicketSale.objects.create(bus=self.disrupted.bus, trip=self.disrupted, amount=1000)
+
+        transfer_bookings(self.disrupted.id, self.replacement.id)
+
+        self.assertEqual(set(TicketSale.objects.filter(trip=self.replacement, bus=self.replacement.bus)
+                             .values_list('booking_id', flat=True)), {b.id for b in moved})
+        self.assertEqual(set(TicketSale.objects.filter(trip=self.disrupted).values_list('id', flat=True)),
+                         {canceled.sales.get().id, unlinked.id})
+        points = dict(Loyalty.objects.values_list('customer_id', 'points'))
+        self.assertEqual(points, {c.id: DISRUPTION_BONUS_POINTS for c in self.customers[:2]})
+        self.assertEqual(OutboxEvent.objects.filter(topic="booking.rescheduled").count(), 2)
+
+
+
+class DashboardRenderingTests(TestCase):
+    def add_bookings(self, customer, count):
+        # Each booking on its own trip and bus, so per-row lookups would show.
+        return [Booking.objects.create(customer=customer, trip=make_trip(), seat_number="1A") for _ in range(count)]
+
+    def assertConstantQueries(self, url, grow):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        grow()
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(url)
+        return response
+
+    def test_id_urls_match_reverse(self):
+        for name, url in dashboard_urls().items():
+            for pk in (1, 42, IdURL.SENTINEL + 1):
+                self.assertEqual(with_id(url, pk), reverse(name, args=[pk]))
+
+    def test_customer_dashboard_query_count_does_not_grow_with_rows(self):
+        customer = User.objects.create_user("rider")
+        self.client.force_login(customer)
+        self.add_bookings(customer, 1)
+        response = self.assertConstantQueries(reverse('customer_dashboard'), lambda: self.add_bookings(customer, 5))
+        booking = Booking.objects.filter(customer=customer).latest('id')
+        self.assertContains(response, reverse('cancel_booking', args=[booking.id]))
+        self.assertContains(response, reverse('payment_page', args=[booking.trip_id]))
+
+    def test_admin_dashboard_query_count_does_not_grow_with_rows(self):
+        admin = User.objects.create_user("staff", is_staff=True)
+        customer = User.objects.create_user("rider")
+        self.client.force_login(admin)
+        self.add_bookings(customer, 1)
+        response = self.assertConstantQueries(reverse('admin_dashboard'), lambda: self.add_bookings(customer, 5))
+        booking = Booking.objects.latest('id')
+        self.assertContains(response, reverse('generate_receipt', args=[booking.id]))
+        self.assertContains(response, reverse('update_bus', args=[booking.trip.bus_id]))
+
+
+@override_settings(
+    RATE_LIMIT_BACKEND='local',
+    RATE_LIMITS={
+        'get_trip_price': [{'key': 'ip', 'rate': '3/m'}],
+        'payment_page': [{'key': 'user', 'rate': '2/m', 'methods': ['POST']}],
+    },
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        reset_rate_limits(self)
+
+    def test_requests_over_the_limit_get_429(self):
+        url = reverse('get_trip_price')
+        statuses = [self.client.get(url, {'origin_id': 1, 'destination_id': 2}).status_code for _ in range(3)]
+        self.assertNotIn(429, statuses)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'origin_id': 1, 'destination_id': 2})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        other = self.client.get(url, {'origin_id': 1, 'destination_id': 2}, REMOTE_ADDR="10.0.0.2")
+        self.assertNotEqual(other.status_code, 429)
+
+    def test_user_rules_follow_the_account_not_the_address(self):
+        trip = make_trip(seats=4)
+        url = reverse('payment_page', args=[trip.id])
+        first, second = make_customers(2)
+        self.client.force_login(first)
+        for ip in ("10.0.0.1", "10.0.0.2"):
+            self.assertNotEqual(self.client.post(url, {}, REMOTE_ADDR=ip).status_code, 429)
+        self.assertEqual(self.client.post(url, {}, REMOTE_ADDR="10.0.0.3").status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)  # rule is POST only
+
+        self.client.force_login(second)
+        self.assertNotEqual(self.client.post(url, {}, REMOTE_ADDR="10.0.0.3").status_code, 429)
+
+    def test_unlisted_views_are_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheRateLimitBackendTests(SimpleTestCase):
+    def test_sliding_window_counts_the_previous_window(self):
+        backend = ratelimit.CacheBackend()
+        backend.cache.clear()
+        with mock.patch('bus_booking.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual([backend.hit("k", 3, 60) for _ in range(3)], [0, 0, 0])
+            self.assertGreater(backend.hit("k", 3, 60), 0)
+        # Halfway through the next window, half of the previous count still applies.
+        with mock.patch('bus_booking.ratelimit.time.time', return_value=1050.0):
+            self.assertEqual(backend.hit("k", 3, 60), 0)
+            self.assertGreater(backend.hit("k", 3, 60), 0)
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate("30/m"), (30, 60))
+        self.assertEqual(ratelimit.parse_rate("5/s"), (5, 1))
+        self.assertEqual(ratelimit.parse_rate("100/hour"), (100, 3600))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TimetableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip = make_trip(seats=4)
+            self.other = make_trip(seats=4, hours=30)
+        self.customer = User.objects.create_user("rider")
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", **headers)
+        if response.status_code == 200:
+            return response, json.loads(gzip.decompress(response.content))
+        return response, None
+
+    def column(self, doc, rows, field):
+        return [(row[0], row[doc['fields'].index(field)]) for row in rows]
+
+    def test_snapshot_lists_upcoming_trips_and_honours_etag(self):
+        response, doc = self.fetch(reverse('timetable_snapshot'))
+        self.assertEqual(response['Content-Encoding'], "gzip")
+        self.assertEqual(self.column(doc, doc['trips'], 'seats_left'), [(self.trip.id, 4), (self.other.id, 4)])
+
+        response, _ = self.fetch(reverse('timetable_snapshot'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_snapshot_price_is_the_charged_quote(self):
+        RoutePrice.objects.create(origin=Location.objects.create(name="Nairobi"),
+                                  destination=Location.objects.create(name="Mombasa"), price=1200)
+        _, doc = self.fetch(reverse('timetable_snapshot'))
+        self.assertEqual(self.column(doc, doc['trips'], 'price'),
+                         [(trip.id, float(pricing.get_quote(trip))) for trip in (self.trip, self.other)])
+
+    def test_up_to_date_poll_gets_an_empty_delta(self):
+        version = timetable.current_version()
+        url = f"{reverse('timetable_changes')}?since={version}"
+        response, doc = self.fetch(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((doc['version'], doc['upserts'], doc['removed']), (version, [], []))
+
+        response, _ = self.fetch(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_delta_reports_changed_and_removed_trips(self):
+        version = timetable.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(customer=self.customer, trip=self.trip, seat_number="1A")
+            self.other.active = False
+            self.other.save()
+
+        response, doc = self.fetch(f"{reverse('timetable_changes')}?since={version}")
+        self.assertEqual(doc['since'], version)
+        self.assertGreater(doc['version'], version)
+        self.assertEqual(doc['removed'], [self.other.id])
+        self.assertEqual(self.column(doc, doc['upserts'], 'seats_left'), [(self.trip.id, 3)])
+
+        # The cached snapshot is patched forward to the same result.
+        _, snapshot = self.fetch(reverse('timetable_snapshot'))
+        self.assertEqual(snapshot['version'], doc['version'])
+        self.assertEqual(snapshot['trips'], doc['upserts'])
+
+    def test_repricing_is_published_in_the_delta(self):
+        self.fetch(reverse('timetable_snapshot'))
+        cache.set(pricing.shard_key(self.trip.id), {self.trip.id: 1}, pricing.QUOTE_TIMEOUT)
+        version = timetable.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            pricing.reprice_upcoming_trips()
+
+        _, doc = self.fetch(f"{reverse('timetable_changes')}?since={version}")
+        self.assertEqual(self.column(doc, doc['upserts'], 'price'), [(self.trip.id, float(pricing.get_quote(self.trip)))])
+
+    def test_unknown_version_falls_back_to_full_snapshot(self):
+        _, doc = self.fetch(f"{reverse('timetable_changes')}?since=999999")
+        self.assertIn('trips', doc)
+        self.assertEqual(self.client.get(reverse('timetable_changes'), {'since': 'x'}).status_code, 400)
+
+
+class SeedDataTests(TestCase):
+    options = dict(locations=5, buses=6, customers=20, years=0.05, days_ahead=5, trips_per_day=4, bookings=300,
+                   seed=7)
+
+    def seed(self):
+        call_command('seed_data', anchor_date=timezone.localdate(), stdout=io.StringIO(), **self.options)
+
+    def fingerprint(self):
+        return list(Booking.objects.order_by('id').values_list(
+            'customer__username', 'trip__origin', 'trip__destination', 'trip__departure_time', 'seat_number', 'status'))
+
+    def test_seeds_linked_bookings_and_sales(self):
+        self.seed()
+        self.assertEqual(Location.objects.count(), 5)
+        self.assertEqual(Bus.objects.count(), 6)
+        self.assertEqual(User.objects.filter(username__startswith="seed_").count(), 20)
+        self.assertEqual(Trip.objects.count(), (int(0.05 * 365) + 5) * 4)
+        self.assertGreater(Booking.objects.count(), 0)
+        statuses = set(Booking.objects.values_list('status', flat=True))
+        self.assertLessEqual(statuses, set(dict(seed_data.PAST_STATUS_MIX)) | set(dict(seed_data.FUTURE_STATUS_MIX)))
+
+        seats = Booking.objects.values_list('trip_id', 'seat_number')
+        self.assertEqual(len(set(seats)), len(seats))
+        sold = Booking.objects.filter(status__in=seed_data.SOLD_STATUSES)
+        self.assertEqual(TicketSale.objects.count(), sold.count())
+        self.assertFalse(TicketSale.objects.filter(booking=None).exists())
+        self.assertEqual(set(TicketSale.objects.values_list('booking_id', 'trip_id')),
+                         set(sold.values_list('id', 'trip_id')))
+
+        # Ids were assigned by the command; the sequence must carry on after them.
+        latest = Booking.objects.latest('id').id
+        booking = Booking.objects.create(customer=make_customers(1)[0], trip=Trip.objects.first(), seat_number="X1")
+        self.assertGreater(booking.id, latest)
+
+    def test_same_seed_gives_same_data(self):
+        runs = []
+        for _ in range(2):
+            with transaction.atomic():
+                self.seed()
+                runs.append(self.fingerprint())
+                transaction.set_rollback(True)
+        self.assertTrue(runs[0])
+        self.assertEqual(runs[0], runs[1])
+
+    def test_refuses_to_seed_twice(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class StaticFilesTests(SimpleTestCase):
+    css = b"body { color: #123456; }\n" * 40
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.storage = CompressedManifestStaticFilesStorage(location=self.root, base_url="/static/")
+
+    def write(self, name, data):
+        os.makedirs(os.path.dirname(os.path.join(self.root, name)), exist_ok=True)
+        with open(os.path.join(self.root, name), 'wb') as fh:
+            fh.write(data)
+
+    def serve(self, path, **headers):
+        with override_settings(DEBUG=False, STATIC_ROOT=self.root, STATIC_URL="/static/"):
+            middleware = StaticFilesMiddleware(lambda request: None)
+        return middleware(RequestFactory().get(path, **headers))
+
+    def test_text_assets_get_gzip_variant(self):
+        self.write("css/site.0123456789ab.css", self.css)
+        self.write("img/logo.0123456789ab.jpg", b"\xff\xd8" * 400)
+        self.write("css/tiny.0123456789ab.css", b"a{}")
+        for name in ("css/site.0123456789ab.css", "img/logo.0123456789ab.jpg", "css/tiny.0123456789ab.css"):
+            self.storage.compress(name)
+
+        with open(os.path.join(self.root, "css/site.0123456789ab.css.gz"), 'rb') as fh:
+            self.assertEqual(gzip.decompress(fh.read()), self.css)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "img/logo.0123456789ab.jpg.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "css/tiny.0123456789ab.css.gz")))
+
+    def test_hashed_files_are_immutable_and_precompressed(self):
+        self.write("css/site.0123456789ab.css", self.css)
+        self.storage.compress("css/site.0123456789ab.css")
+
+        response = self.serve("/static/css/site.0123456789ab.css", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        body = b"".join(response.streaming_content)
+        self.assertEqual(response['Content-Encoding'], "gzip")
+        self.assertEqual(response['Content-Type'], "text/css")
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Vary'], "Accept-Encoding")
+        self.assertIn('filename="site.0123456789ab.css"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(body), self.css)
+
+        response = self.serve("/static/css/site.0123456789ab.css")
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b"".join(response.streaming_content), self.css)
+
+    def test_unhashed_and_missing_files(self):
+        self.write("css/site.css", self.css)
+        self.assertEqual(self.serve("/static/css/site.css")['Cache-Control'], REVALIDATE)
+        for path in ("/static/css/nope.css", "/static/../settings.py"):
+            with self.assertRaises(Http404):
+                self.serve(path)
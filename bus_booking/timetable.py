@@ -0,0 +1,170 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Booking, Bus, RoutePrice, Trip, TripChange, ACTIVE_BOOKING_STATUSES
+from . import pricing
+
+SNAPSHOT_KEY = "timetable:snapshot"
+# Rebuild a cached snapshot at least this often, and fall back to a full
+# snapshot when a delta would touch more trips than MAX_DELTA_TRIPS.
+SNAPSHOT_TIMEOUT = 60 * 5
+MAX_DELTA_TRIPS = 5000
+# TripChange rows older than this are pruned; clients further behind get
+# the full snapshot.
+CHANGE_RETENTION = timedelta(days=2)
+PRUNE_EVERY = 1000
+
+FIELDS = ['id', 'origin', 'destination', 'departure', 'arrival', 'price', 'seats_left']
+
+
+def trip_rows(trip_ids=None):
+    """
+    {trip_id: row} for upcoming bookable trips, one query. Rows are lists in
+    FIELDS order with times as POSIX seconds, to keep the document small.
+    "price" is the cached quote from pricing.get_quotes(), the fare
+    payment_page charges.
+    """
+    trips = (Trip.objects
+             .filter(active=True, bus__is_available=True, departure_time__gt=timezone.now())
+             .annotate(taken=Count('booking', filter=Q(booking__status__in=ACTIVE_BOOKING_STATUSES))))
+    if trip_ids is not None:
+        trips = trips.filter(id__in=trip_ids)
+    trips = list(trips.values_list('id', 'origin', 'destination', 'departure_time', 'arrival_time', 'price',
+                                   'bus__total_seats', 'taken'))
+    quotes = pricing.get_quotes([(trip_id, origin, destination, departure, price, seats, taken)
+                                 for trip_id, origin, destination, departure, _, price, seats, taken in trips])
+    rows = {}
+    for trip_id, origin, destination, departure, arrival, _, seats, taken in trips:
+        rows[trip_id] = [
+            trip_id, origin, destination, int(departure.timestamp()),
+            int(arrival.timestamp()) if arrival else None,
+            float(quotes[trip_id]), max(seats - taken, 0),
+        ]
+    return rows
+
+
+def current_version():
+    return TripChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def log_changes(trip_ids):
+    """Append trip_ids to the change log; returns the new version."""
+    rows = TripChange.objects.bulk_create([TripChange(trip_id=trip_id) for trip_id in set(trip_ids)], batch_size=1000)
+    if not rows:
+        return None
+    if rows[-1].id // PRUNE_EVERY != (rows[0].id - 1) // PRUNE_EVERY:
+        prune_changes(rows[-1].id)
+    return rows[-1].id
+
+
+def prune_changes(latest):
+    TripChange.objects.filter(created_at__lt=timezone.now() - CHANGE_RETENTION, id__lt=latest).delete()
+
+
+def trips_changed(trip_ids):
+    """
+    Log trip_ids once the current transaction commits, so a version is never
+    handed out for a change readers cannot see yet.
+    """
+    trip_ids = list(trip_ids)
+    if trip_ids:
+        transaction.on_commit(lambda: log_changes(trip_ids))
+
+
+def changed_between(since, version):
+    """Ids of trips changed in versions since+1..version, or None if the log no longer covers them."""
+    oldest = TripChange.objects.aggregate(oldest=Min('id'))['oldest']
+    if since > version or (oldest is not None and since < oldest - 1):
+        return None
+    trip_ids = set(TripChange.objects.filter(id__gt=since, id__lte=version).values_list('trip_id', flat=True))
+    return trip_ids if len(trip_ids) <= MAX_DELTA_TRIPS else None
+
+
+def snapshot():
+    """
+    (version, gzipped JSON bytes) of the full timetable. The cached copy is
+    patched forward with the change log when possible, so a trip or booking
+    change costs one small query rather than a rebuild of the whole list.
+    """
+    version = current_version()
+    cached = cache.get(SNAPSHOT_KEY)
+    if cached is not None and cached['version'] == version:
+        return version, cached['body']
+
+    rows = None
+    if cached is not None and cached['version'] < version:
+        changed = changed_between(cached['version'], version)
+        if changed is not None:
+            rows = cached['rows']
+            fresh = trip_rows(changed)
+            for trip_id in changed:
+                if trip_id in fresh:
+                    rows[trip_id] = fresh[trip_id]
+                else:
+                    rows.pop(trip_id, None)
+    if rows is None:
+        rows = trip_rows()
+
+    now = int(time.time())
+    rows = {trip_id: row for trip_id, row in rows.items() if row[3] > now}
+    body = compress({'version': version, 'fields': FIELDS, 'trips': sorted(rows.values(), key=lambda r: (r[3], r[0]))})
+    cache.set(SNAPSHOT_KEY, {'version': version, 'rows': rows, 'body': body}, SNAPSHOT_TIMEOUT)
+    return version, body
+
+
+def delta(since):
+    """
+    (version, gzipped JSON bytes) of what changed after version `since`:
+    rows to upsert and ids to drop. Falls back to the full snapshot, which
+    has "trips" instead of "upserts", when the log no longer reaches back.
+    """
+    version = current_version()
+    changed = changed_between(since, version)
+    if changed is None:
+        return snapshot()
+    rows = trip_rows(changed)
+    upserts = sorted(rows.values(), key=lambda r: (r[3], r[0]))
+    removed = sorted(changed - rows.keys())
+    return version, compress({'version': version, 'since': since, 'fields': FIELDS,
+                              'upserts': upserts, 'removed': removed})
+
+
+def compress(document):
+    return gzip.compress(json.dumps(document, separators=(',', ':')).encode(), compresslevel=6, mtime=0)
+
+
+@receiver([post_save, post_delete], sender=Trip)
+def trip_changed(sender, instance, **kwargs):
+    trips_changed([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    trips_changed([instance.trip_id])
+
+
+@receiver(post_save, sender=Bus)
+def bus_changed(sender, instance, **kwargs):
+    trips_changed(Trip.objects.filter(bus=instance, departure_time__gt=timezone.now()).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=RoutePrice)
+def route_price_changed(sender, instance, **kwargs):
+    trips_changed(Trip.objects
+                  .filter(origin=instance.origin.name, destination=instance.destination.name,
+                          departure_time__gt=timezone.now())
+                  .values_list('id', flat=True))
+
+
+@receiver(pricing.quotes_changed)
+def quotes_changed(sender, trip_ids, **kwargs):
+    trips_changed(trip_ids)
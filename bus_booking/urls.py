@@ -10,11 +10,20 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('customer-dashboard/', views.customer_dashboard, name='customer_dashboard'),
+    path('bookings/history/', views.booking_history, name='booking_history'),
+    path('api/bookings/history/', views.booking_history_api, name='booking_history_api'),
     path('register/', views.register_customer, name='register_customer'),
     path('create-trip/', views.create_trip, name='create_trip'),
+    path('update-bus/<int:bus_id>/', views.update_bus, name='update_bus'),
     path('booking/cancel/<int:pk>/', views.cancel_booking, name='cancel_booking'),
     path('booking/reschedule/<int:pk>/', views.reschedule_booking, name='reschedule_booking'),
     path('payment/<int:trip_id>/', views.payment_page, name='payment_page'),
+    path('waitlist/join/<int:trip_id>/', views.join_waitlist, name='join_waitlist'),
+    path('waitlist/accept/<int:pk>/', views.accept_waitlist_offer, name='accept_waitlist_offer'),
+    path('waitlist/decline/<int:pk>/', views.decline_waitlist_offer, name='decline_waitlist_offer'),
     path('get-trip-price/', views.get_trip_price, name='get_trip_price'),
+    path('plan-journey/', views.journey_search, name='journey_search'),
+    path('api/timetable/', views.timetable_snapshot, name='timetable_snapshot'),
+    path('api/timetable/changes/', views.timetable_changes, name='timetable_changes'),
     
 ]
@@ -1,26 +1,53 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponse, Http404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Sum
-from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+from datetime import datetime, timedelta
+import gzip
+from django.db import transaction
+from django.db.models import Sum, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 
 from django.http import JsonResponse
-from .models import Trip, Booking, Loyalty, Bus, TicketSale
+from .models import Trip, Booking, Bus, TicketSale
 from .forms import CustomUserCreationForm, TripForm, BusUpdateForm
-from .models import RoutePrice, Location
+from .models import Location, WaitlistEntry, ACTIVE_BOOKING_STATUSES
+from .outbox import publish
+from .pricing import get_quote, route_prices_by_id
+from .journeys import plan_journey, FIRST_LEG_WINDOW
+from .waitlist import held_seats, open_offer, accept_offer, decline_offer
+from . import timetable
  
+class IdURL:
+    """A URL pattern with a single integer argument, reversed once and filled per row."""
+    SENTINEL = 987654321
+
+    def __init__(self, name):
+        self.prefix, self.suffix = reverse(name, args=[self.SENTINEL]).split(str(self.SENTINEL))
+
+def dashboard_urls():
+    return {name: IdURL(name) for name in (
+        'payment_page', 'cancel_booking', 'reschedule_booking', 'download_receipt',
+        'generate_receipt', 'update_bus',
+    )}
+
 def is_customer(user): return user.role == 'CUSTOMER'
 def is_admin_or_super(user): return user.role == 'ADMIN' or user.is_superuser
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+HISTORY_FIELDS = (
+    'id', 'seat_number', 'status', 'loyalty_points', 'booking_date',
+    'trip__id', 'trip__origin', 'trip__destination', 'trip__departure_time', 'trip__price',
+    'trip__bus__id', 'trip__bus__bus',
+)
+JOURNEY_MAX_WINDOW_HOURS = 24 * 14
+
 def process_card_payment(): return True
 def process_mpesa_payment(): return True
 
@@ -53,46 +80,196 @@ def logout_view(request):
 @login_required
 @user_passes_test(is_customer)
 def customer_dashboard(request):
-    bookings = Booking.objects.filter(customer=request.user).order_by('-booking_date')
-    trips = Trip.objects.filter(bus__is_available=True, departure_time__gt=timezone.now())
+    bookings = Booking.objects.filter(customer=request.user).select_related('trip').order_by('-booking_date', '-id')
+    trips = Trip.objects.filter(bus__is_available=True, departure_time__gt=timezone.now()).select_related('bus')
     total_trips = bookings.filter(status="BOOKED").count()
+    waitlist = (WaitlistEntry.objects
+                .filter(customer=request.user, status__in=[WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED],
+                        trip__departure_time__gt=timezone.now())
+                .select_related('trip'))
     return render(request, 'bus_booking/customer_dashboard.html', {
         'trips': trips,
-        'bookings': bookings,
+        'bookings': bookings[:HISTORY_PAGE_SIZE],
+        'waitlist': waitlist,
+        'urls': dashboard_urls(),
         'eligible_for_free_trip': total_trips >= 4,
     })
 
+
+def encode_history_cursor(booking):
+    raw = f"{booking.booking_date.isoformat()}|{booking.id}"
+    return urlsafe_base64_encode(raw.encode())
+
+def decode_history_cursor(cursor):
+    try:
+        booking_date, pk = urlsafe_base64_decode(cursor).decode().split("|")
+        booking_date = parse_datetime(booking_date)
+        if booking_date is None: return None
+        return booking_date, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def booking_history_page(request):
+    """
+    One keyset-paginated page of the current customer's bookings, newest first.
+    Returns (bookings, next_cursor) or raises ValueError on bad input.
+    """
+    bookings = (Booking.objects.filter(customer=request.user)
+                .select_related('trip__bus')
+                .only(*HISTORY_FIELDS)
+                .order_by('-booking_date', '-id'))
+
+    now = timezone.now()
+    status_filter = request.GET.get('filter')
+    if status_filter == 'upcoming':
+        bookings = bookings.filter(status__in=ACTIVE_BOOKING_STATUSES, trip__departure_time__gt=now)
+    elif status_filter == 'past':
+        bookings = bookings.filter(status__in=ACTIVE_BOOKING_STATUSES, trip__departure_time__lte=now)
+    elif status_filter == 'canceled':
+        bookings = bookings.filter(status="CANCELED")
+    elif status_filter:
+        raise ValueError("Unknown filter")
+
+    try:
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("Invalid limit")
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = decode_history_cursor(cursor)
+        if position is None: raise ValueError("Invalid cursor")
+        booking_date, pk = position
+        bookings = bookings.filter(Q(booking_date__lt=booking_date) | Q(booking_date=booking_date, id__lt=pk))
+
+    page = list(bookings[:limit + 1])
+    next_cursor = encode_history_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+@login_required
+@user_passes_test(is_customer)
+def booking_history(request):
+    try:
+        bookings, next_cursor = booking_history_page(request)
+    except ValueError as exc:
+        messages.error(request, str(exc))
+        return redirect('booking_history')
+    return render(request, 'bus_booking/booking_history.html', {
+        'bookings': bookings,
+        'next_cursor': next_cursor,
+        'current_filter': request.GET.get('filter', ''),
+        'urls': dashboard_urls(),
+    })
+
+@login_required
+@user_passes_test(is_customer)
+def booking_history_api(request):
+    try:
+        bookings, next_cursor = booking_history_page(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'results': [{
+            'id': b.id,
+            'seat_number': b.seat_number,
+            'status': b.status,
+            'loyalty_points': b.loyalty_points,
+            'booking_date': b.booking_date,
+            'trip': {
+                'id': b.trip.id,
+                'bus': b.trip.bus.bus,
+                'origin': b.trip.origin,
+                'destination': b.trip.destination,
+                'departure_time': b.trip.departure_time,
+                'price': b.trip.price,
+            },
+        } for b in bookings],
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 @user_passes_test(is_customer)
 def payment_page(request, trip_id):
     trip = get_object_or_404(Trip, id=trip_id)
     if not trip.is_available(): raise Http404("Trip is no longer available")
 
-    rows = trip.bus.total_seats // trip.bus.seats_per_row
-    letters = list("ABCD")[:trip.bus.seats_per_row]
-    all_seats = [f"{r+1}{letters[c]}" for r in range(rows) for c in range(len(letters))]
-    taken = Booking.objects.filter(trip=trip, status__in=["BOOKED", "PAID", "FREE"]).values_list("seat_number", flat=True)
-    available_seats = [s for s in all_seats if s not in taken]
+    taken = set(Booking.objects.filter(trip=trip, status__in=ACTIVE_BOOKING_STATUSES).values_list("seat_number", flat=True))
+    # Seats offered to other waitlisted customers are off limits; the
+    # customer's own offer shows up as available (and preselected).
+    taken |= held_seats([trip.id], exclude_customer=request.user)[trip.id]
+    available_seats = [s for s in trip.bus.seat_labels() if s not in taken]
+    fare = get_quote(trip)
 
     if request.method == "POST":
         selected_seat = request.POST.get("seat_number")
         method = request.POST.get("payment_method")
+        if selected_seat not in available_seats:
+            messages.error(request, "That seat is no longer available.")
+            return redirect('payment_page', trip_id=trip.id)
         payment_success = (method == "cash") or (method == "card" and process_card_payment()) or (method == "mpesa" and process_mpesa_payment())
 
         if payment_success:
-            booking = Booking.objects.create(customer=request.user, trip=trip, seat_number=selected_seat)
-            booking.calculate_loyalty_points()
-            booking.set_free_trip()
-            booking.status = "PAID"
-            booking.save()
-            TicketSale.objects.create(bus=trip.bus, trip=trip, amount=trip.price)
-            loyalty, _ = Loyalty.objects.get_or_create(customer=request.user)
-            loyalty.points += booking.loyalty_points
-            loyalty.save()
+            with transaction.atomic():
+                booking = Booking.objects.create(customer=request.user, trip=trip, seat_number=selected_seat)
+                booking.calculate_loyalty_points()
+                booking.set_free_trip()
+                booking.status = "PAID"
+                booking.save()
+                sale = TicketSale.objects.create(bus=trip.bus, trip=trip, booking=booking, amount=fare)
+                publish("booking.paid", booking_id=booking.id, customer_id=request.user.id, trip_id=trip.id,
+                        loyalty_points=booking.loyalty_points, payment_method=method)
+                publish("ticket.sold", sale_id=sale.id, booking_id=booking.id, bus_id=trip.bus_id, trip_id=trip.id,
+                        amount=str(sale.amount))
+                accept_offer(request.user, booking)
             messages.success(request, f"Payment successful with {method}. Booking confirmed as PAID!")
             return redirect('customer_dashboard')
         messages.error(request, "Payment failed. Please try again.")
-    return render(request, 'bus_booking/payment_page.html', {'trip': trip, 'available_seats': available_seats})
+    entry = (WaitlistEntry.objects
+             .filter(trip=trip, customer=request.user,
+                     status__in=[WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED])
+             .values('status', 'offered_seat', 'offer_expires_at').first())
+    offered_seat = None
+    if entry and entry['status'] == WaitlistEntry.Statuses.OFFERED and entry['offer_expires_at'] > timezone.now():
+        offered_seat = entry['offered_seat']
+    return render(request, 'bus_booking/payment_page.html', {
+        'trip': trip, 'fare': fare, 'available_seats': available_seats, 'on_waitlist': entry is not None,
+        'offered_seat': offered_seat,
+    })
+
+@login_required
+@user_passes_test(is_customer)
+def join_waitlist(request, trip_id):
+    trip = get_object_or_404(Trip, id=trip_id)
+    if request.method != "POST" or not trip.is_available():
+        return redirect('customer_dashboard')
+    _, created = WaitlistEntry.objects.get_or_create(
+        trip=trip, customer=request.user,
+        status__in=[WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED],
+        defaults={'status': WaitlistEntry.Statuses.WAITING},
+    )
+    if created:
+        messages.success(request, "You are on the waitlist. We will offer you a seat as soon as one frees up.")
+    else:
+        messages.info(request, "You are already on the waitlist for this trip.")
+    return redirect('customer_dashboard')
+
+@login_required
+@user_passes_test(is_customer)
+def accept_waitlist_offer(request, pk):
+    entry = open_offer(pk, request.user) if request.method == "POST" else None
+    if entry is None:
+        messages.error(request, "This offer has expired or is no longer available.")
+        return redirect('customer_dashboard')
+    expires = timezone.localtime(entry.offer_expires_at).strftime("%H:%M")
+    messages.info(request, f"Seat {entry.offered_seat} is held for you until {expires}. Pay to confirm it.")
+    return redirect('payment_page', trip_id=entry.trip_id)
+
+@login_required
+@user_passes_test(is_customer)
+def decline_waitlist_offer(request, pk):
+    if request.method == "POST" and decline_offer(pk, request.user):
+        messages.success(request, "Offer declined.")
+    return redirect('customer_dashboard')
 
  
 @login_required
@@ -100,8 +277,10 @@ def payment_page(request, trip_id):
 def cancel_booking(request, pk):
     booking = get_object_or_404(Booking, pk=pk, customer=request.user)
     if booking.status in ["BOOKED", "PAID", "RESCHEDULED"]:
-        booking.status = "CANCELED"
-        booking.save()
+        with transaction.atomic():
+            booking.status = "CANCELED"
+            booking.save()
+            publish("booking.canceled", booking_id=booking.id, customer_id=request.user.id, trip_id=booking.trip_id)
         messages.success(request, "Your booking has been successfully canceled.")
     else:
         messages.error(request, "You can only cancel a booked, paid or rescheduled trip.")
@@ -118,9 +297,13 @@ def reschedule_booking(request, pk):
     if request.method == "POST":
         new_trip = get_object_or_404(Trip, id=request.POST.get('new_trip'))
         if new_trip.is_available():
-            booking.trip = new_trip
-            booking.status = "RESCHEDULED"
-            booking.save()
+            with transaction.atomic():
+                old_trip_id = booking.trip_id
+                booking.trip = new_trip
+                booking.status = "RESCHEDULED"
+                booking.save()
+                publish("booking.rescheduled", booking_id=booking.id, customer_id=request.user.id,
+                        from_trip_id=old_trip_id, to_trip_id=new_trip.id)
             messages.success(request, "Your booking has been successfully rescheduled.")
             return redirect('customer_dashboard')
         messages.error(request, "The selected trip is not available.")
@@ -144,8 +327,9 @@ def admin_dashboard(request):
                 .order_by('-total_profit'))
 
     return render(request, 'bus_booking/admin_dashboard.html', {
-        'bookings': Booking.objects.all(),
-        'buses': Trip.objects.all(),
+        'bookings': Booking.objects.select_related('customer', 'trip'),
+        'buses': Trip.objects.select_related('bus'),
+        'urls': dashboard_urls(),
         'daily_profits': calculate_profit('daily'),
         'weekly_profits': calculate_profit('weekly'),
         'monthly_profits': calculate_profit('monthly'),
@@ -168,33 +352,8 @@ def update_bus(request, bus_id):
 @user_passes_test(is_customer)
 def download_receipt(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, customer=request.user)
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    try:
-        logo = RLImage('static/logo/logo.jpeg', width=100, height=100)
-        elements += [logo, Spacer(1,12)]
-    except: pass
-
-    elements.append(Paragraph("QuickTransit Receipt", styles['Title']))
-    elements.append(Spacer(1,12))
-    data = [["Field","Value"],["Customer",booking.customer.username],
-            ["Trip",str(booking.trip)],["Seat",booking.seat_number],
-            ["Status",booking.status],["Date",booking.booking_date.strftime("%Y-%m-%d %H:%M:%S")],
-            ["Points",booking.loyalty_points]]
-    table = Table(data, colWidths=[150,300])
-    table.setStyle(TableStyle([
-        ('BACKGROUND',(0,0),(-1,0),colors.grey),
-        ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
-        ('ALIGN',(0,0),(-1,-1),'LEFT'),
-        ('GRID',(0,0),(-1,-1),1,colors.black)
-    ]))
-    elements += [table, Spacer(1,12), Paragraph("Thank you!",styles['Normal'])]
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
+    from .receipts import build_receipt_pdf
+    pdf = build_receipt_pdf(booking)
     response = HttpResponse(pdf, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="receipt_{booking.id}.pdf"'
     return response
@@ -238,14 +397,102 @@ def register_customer(request):
  
 
 def get_trip_price(request):
+    trip_id = request.GET.get('trip_id')
     origin_id = request.GET.get('origin_id')
     destination_id = request.GET.get('destination_id')
 
-    if origin_id and destination_id:
-        try:
-            price = RoutePrice.objects.get(origin_id=origin_id, destination_id=destination_id).price
-            return JsonResponse({'price': price})
-        except RoutePrice.DoesNotExist:
+    if trip_id and trip_id.isdigit():
+        trip = Trip.objects.filter(id=trip_id, active=True).select_related('bus').first()
+        if trip is None:
+            return JsonResponse({'error': 'Trip not found'}, status=404)
+        return JsonResponse({'price': get_quote(trip)})
+
+    if origin_id and destination_id and origin_id.isdigit() and destination_id.isdigit():
+        price = route_prices_by_id().get((int(origin_id), int(destination_id)))
+        if price is None:
             return JsonResponse({'error': 'Price not found'}, status=404)
+        return JsonResponse({'price': price})
 
     return JsonResponse({'error': 'Invalid input'}, status=400)
+
+
+def journey_search(request):
+    origin = request.GET.get('origin')
+    destination = request.GET.get('destination')
+    optimize = request.GET.get('optimize', 'arrival')
+    if not origin or not destination or optimize not in ('arrival', 'price'):
+        return JsonResponse({'error': 'Invalid input'}, status=400)
+
+    depart_after = None
+    if request.GET.get('depart_after'):
+        depart_after = parse_datetime(request.GET['depart_after'])
+        if depart_after is None:
+            return JsonResponse({'error': 'Invalid depart_after'}, status=400)
+        if timezone.is_naive(depart_after):
+            depart_after = timezone.make_aware(depart_after)
+
+    within_hours = request.GET.get('within_hours', '')
+    if within_hours and not (within_hours.isdigit() and 0 < int(within_hours) <= JOURNEY_MAX_WINDOW_HOURS):
+        return JsonResponse({'error': f'within_hours must be 1-{JOURNEY_MAX_WINDOW_HOURS}'}, status=400)
+    window = timedelta(hours=int(within_hours)) if within_hours else FIRST_LEG_WINDOW
+
+    legs = plan_journey(origin, destination, depart_after, optimize, first_leg_window=window)
+    if not legs:
+        return JsonResponse({'error': 'No journey found', 'within_hours': int(window.total_seconds() // 3600)},
+                            status=404)
+
+    def as_datetime(ts):
+        return datetime.fromtimestamp(ts, tz=timezone.get_current_timezone())
+
+    return JsonResponse({
+        'legs': [{
+            'trip_id': leg.trip_id,
+            'origin': leg.origin,
+            'destination': leg.destination,
+            'departure_time': as_datetime(leg.departure),
+            'arrival_time': as_datetime(leg.arrival),
+            'price': leg.price,
+        } for leg in legs],
+        'total_price': sum(leg.price for leg in legs),
+        'arrival_time': as_datetime(legs[-1].arrival),
+    })
+
+
+def timetable_response(request, version, body, etag):
+    """Serve a gzipped timetable document, honouring If-None-Match and Accept-Encoding."""
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(body, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(body), content_type='application/json')
+    response['ETag'] = etag
+    response['X-Timetable-Version'] = str(version)
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def timetable_snapshot(request):
+    """
+    Every upcoming bookable trip with its current fare and free seats. Clients
+    keep the copy, revalidate with If-None-Match and then poll
+    timetable_changes with the version they hold.
+    """
+    version, body = timetable.snapshot()
+    return timetable_response(request, version, body, f'"timetable-{version}"')
+
+
+def timetable_changes(request):
+    """
+    Rows changed since ?since=<version>; an empty delta when nothing has.
+    Departed trips are not listed as removed; clients drop rows whose
+    departure has passed.
+    """
+    since = request.GET.get('since', '')
+    if not since.isdigit():
+        return JsonResponse({'error': 'Invalid since'}, status=400)
+    since = int(since)
+    version, body = timetable.delta(since)
+    return timetable_response(request, version, body, f'"timetable-{since}-{version}"')
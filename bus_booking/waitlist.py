@@ -0,0 +1,158 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Notification, Trip, WaitlistEntry, ACTIVE_BOOKING_STATUSES
+from .outbox import handles, publish
+
+ACCEPT_WINDOW = timedelta(minutes=15)
+TRIP_BATCH_SIZE = 100
+
+
+def held_seats(trip_ids, exclude_customer=None):
+    """{trip_id: set of seats} held by unexpired waitlist offers."""
+    offers = WaitlistEntry.objects.filter(
+        trip_id__in=trip_ids,
+        status=WaitlistEntry.Statuses.OFFERED,
+        offer_expires_at__gt=timezone.now(),
+    )
+    if exclude_customer is not None:
+        offers = offers.exclude(customer=exclude_customer)
+    held = defaultdict(set)
+    for trip_id, seat in offers.values_list('trip_id', 'offered_seat'):
+        held[trip_id].add(seat)
+    return held
+
+
+def free_seats(trips):
+    """{trip_id: [seat, ...]} not booked and not held by an offer, in seat order."""
+    ids = [trip.id for trip in trips]
+    unavailable = held_seats(ids)
+    for trip_id, seat in (Booking.objects.filter(trip_id__in=ids, status__in=ACTIVE_BOOKING_STATUSES)
+                          .values_list('trip_id', 'seat_number')):
+        unavailable[trip_id].add(seat)
+    return {trip.id: [s for s in trip.bus.seat_labels() if s not in unavailable[trip.id]] for trip in trips}
+
+
+def offer_seats(trip_ids):
+    """
+    Offer every free seat on the given trips to the longest-waiting customers.
+    Trips another worker is already promoting are skipped (SKIP LOCKED), as
+    are waitlist rows locked elsewhere; the periodic sweep picks them up.
+    Returns the list of entries that received an offer.
+    """
+    now = timezone.now()
+    offers = []
+    trip_ids = list(trip_ids)
+    for start in range(0, len(trip_ids), TRIP_BATCH_SIZE):
+        with transaction.atomic():
+            trips = list(Trip.objects
+                         .select_for_update(skip_locked=True, of=('self',))
+                         .select_related('bus')
+                         .filter(id__in=trip_ids[start:start + TRIP_BATCH_SIZE], active=True, departure_time__gt=now))
+            seats = free_seats(trips)
+            waiting = (WaitlistEntry.objects
+                       .select_for_update(skip_locked=True)
+                       .filter(trip_id__in=[t for t, free in seats.items() if free], status=WaitlistEntry.Statuses.WAITING)
+                       .order_by('created_at', 'id'))
+            batch = []
+            for entry in waiting:
+                if seats.get(entry.trip_id):
+                    entry.status = WaitlistEntry.Statuses.OFFERED
+                    entry.offered_seat = seats[entry.trip_id].pop(0)
+                    entry.offer_expires_at = now + ACCEPT_WINDOW
+                    batch.append(entry)
+            WaitlistEntry.objects.bulk_update(batch, ['status', 'offered_seat', 'offer_expires_at'])
+            queue_offer_notifications(batch)
+        offers += batch
+    return offers
+
+
+def queue_offer_notifications(entries):
+    entries = (WaitlistEntry.objects.filter(id__in=[e.id for e in entries])
+               .select_related('customer', 'trip'))
+    notifications = []
+    for entry in entries:
+        trip = entry.trip
+        when = timezone.localtime(trip.departure_time).strftime("%d %b %Y %H:%M")
+        expires = timezone.localtime(entry.offer_expires_at).strftime("%H:%M")
+        body = (f"Seat {entry.offered_seat} on {trip.origin} to {trip.destination} at {when} is available. "
+                f"Accept from your dashboard before {expires}.")
+        for channel, recipient in ((Notification.Channels.EMAIL, entry.customer.email),
+                                   (Notification.Channels.SMS, entry.customer.phone_number)):
+            if recipient:
+                notifications.append(Notification(
+                    customer=entry.customer, channel=channel, kind=Notification.Kinds.WAITLIST_OFFER,
+                    recipient=recipient, subject="QuickTransit seat available", body=body,
+                    dedupe_key=f"{Notification.Kinds.WAITLIST_OFFER}:{entry.id}:{channel}",
+                ))
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+
+def expire_offers():
+    """Expire lapsed offers and return the ids of the trips whose seats they held."""
+    with transaction.atomic():
+        expired = list(WaitlistEntry.objects
+                       .select_for_update(skip_locked=True)
+                       .filter(status=WaitlistEntry.Statuses.OFFERED, offer_expires_at__lte=timezone.now())
+                       .values_list('id', 'trip_id'))
+        WaitlistEntry.objects.filter(id__in=[pk for pk, _ in expired]).update(status=WaitlistEntry.Statuses.EXPIRED)
+    return {trip_id for _, trip_id in expired}
+
+
+def sweep():
+    """Expire lapsed offers, then re-offer seats on every upcoming trip with a queue."""
+    expire_offers()
+    trip_ids = set(WaitlistEntry.objects
+                   .filter(status=WaitlistEntry.Statuses.WAITING, trip__departure_time__gt=timezone.now())
+                   .values_list('trip_id', flat=True).distinct())
+    return offer_seats(sorted(trip_ids))
+
+
+def open_offer(entry_id, customer):
+    """The customer's unexpired offer on a trip that can still be booked, or None."""
+    now = timezone.now()
+    return (WaitlistEntry.objects
+            .filter(pk=entry_id, customer=customer, status=WaitlistEntry.Statuses.OFFERED,
+                    offer_expires_at__gt=now, trip__active=True, trip__departure_time__gt=now,
+                    trip__bus__is_available=True)
+            .select_related('trip').first())
+
+
+def accept_offer(customer, booking):
+    """
+    Close the customer's open waitlist entries for the trip they just paid
+    for. Offers are accepted through payment_page, so call this inside the
+    payment transaction; the booking.paid event there drives confirmations
+    and loyalty. Returns the number of entries closed.
+    """
+    now = timezone.now()
+    entries = list(WaitlistEntry.objects
+                   .filter(customer=customer, trip_id=booking.trip_id,
+                           status__in=[WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED],
+                           trip__active=True, trip__departure_time__gt=now, trip__bus__is_available=True)
+                   .values_list('id', flat=True))
+    closed = WaitlistEntry.objects.filter(
+        id__in=entries, status__in=[WaitlistEntry.Statuses.WAITING, WaitlistEntry.Statuses.OFFERED],
+    ).update(status=WaitlistEntry.Statuses.ACCEPTED)
+    for entry_id in entries:
+        publish("waitlist.accepted", entry_id=entry_id, booking_id=booking.id, customer_id=customer.id,
+                trip_id=booking.trip_id)
+    return closed
+
+
+def decline_offer(entry_id, customer):
+    """Release an offered seat and pass it straight to the next customer in line."""
+    offer = WaitlistEntry.objects.filter(pk=entry_id, customer=customer, status=WaitlistEntry.Statuses.OFFERED)
+    trip_id = offer.values_list('trip_id', flat=True).first()
+    if trip_id is None or not offer.update(status=WaitlistEntry.Statuses.DECLINED):
+        return False
+    offer_seats([trip_id])
+    return True
+
+
+@handles("booking.canceled")
+def promote_waitlist(events):
+    offer_seats(sorted({e.payload['trip_id'] for e in events}))
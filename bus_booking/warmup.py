@@ -0,0 +1,73 @@
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+
+def project_templates():
+    """Relative names of this project's templates (admin's own are left alone)."""
+    roots = [Path(d) for t in settings.TEMPLATES for d in t.get('DIRS', [])]
+    roots.append(Path(__file__).resolve().parent / 'templates')
+    for root in roots:
+        for path in sorted(root.rglob('*.html')):
+            yield path.relative_to(root).as_posix()
+
+
+def warm_up():
+    """
+    Load what the first requests would otherwise pay for: URL resolver
+    caches, compiled templates (kept by the cached loader) and the route
+    price matrix, which lands in the shared cache. Run it in the gunicorn
+    master with preload_app so forked workers inherit the warm state; it
+    keeps no process-local copy of data that changes, since the master
+    never sees invalidations. Database connections are closed afterwards
+    so none is shared across fork(). Returns {step: milliseconds}.
+    """
+    from . import pricing
+
+    def templates():
+        for name in project_templates():
+            try:
+                get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError):
+                logger.warning("Warm-up could not compile template %s", name, exc_info=True)
+
+    def route_prices():
+        pricing.route_prices()
+        pricing.route_prices_by_id()
+
+    timings = {}
+    _step(timings, 'urls', lambda: (get_resolver().url_patterns, reverse('index')))
+    _step(timings, 'templates', templates)
+    _step(timings, 'route_prices', route_prices)
+    connections.close_all()
+    return timings
+
+
+def warm_up_worker():
+    """
+    Build this worker's journey index from current data. Called from
+    gunicorn's post_fork so each (re)started worker begins in sync.
+    """
+    from .journeys import get_index
+
+    timings = {}
+    _step(timings, 'journey_index', get_index)
+    connections.close_all()
+    return timings
+
+
+def _step(timings, name, func):
+    started = time.perf_counter()
+    try:
+        func()
+    except DatabaseError:
+        logger.warning("Warm-up step %s skipped: database unavailable", name, exc_info=True)
+    timings[name] = round((time.perf_counter() - started) * 1000, 1)
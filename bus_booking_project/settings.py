@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
  
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,10 +24,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'bus_booking.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bus_booking.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,6 +57,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'bus_booking_project.wsgi.application'
 
+# Run bus_booking.warmup when the WSGI app is loaded (see gunicorn.conf.py).
+WARM_UP_ON_START = not DEBUG
+
 
  
 DATABASES = {
@@ -68,6 +74,26 @@ DATABASES = {
 }
 
 
+# Fare quotes, the route price matrix and rate-limit counters are shared by
+# every gunicorn worker and management command, so the cache must be too.
+# Set REDIS_URL in production; otherwise the database cache is used (create
+# its table with `python manage.py createcachetable`). A per-process
+# LocMemCache is rejected at startup when DEBUG is off (bus_booking.checks).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'bus_booking_cache',
+        },
+    }
 
  
 AUTH_PASSWORD_VALIDATORS = [
@@ -97,6 +123,22 @@ USE_TZ = True
  
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# With DEBUG off, collectstatic writes content-hashed copies plus .gz/.br
+# variants; see bus_booking.middleware.StaticFilesMiddleware for how they are
+# served. Development and the test suite (settings are loaded with DEBUG on)
+# use plain storage, so {% static %} works without a collected manifest.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'bus_booking.storage.CompressedManifestStaticFilesStorage'),
+    },
+}
+
  
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -107,3 +149,38 @@ LOGIN_REDIRECT_URL = 'dashboard'
  
 
 
+
+# Providers used by bus_booking.notifications, keyed by channel. Unset, the
+# console backends in notifications.DEFAULT_PROVIDERS are used; set e.g.
+#   NOTIFICATION_PROVIDERS = {
+#       'SMS': {'BACKEND': 'myproject.sms.GatewayBackend', 'RATE_PER_SECOND': 10, 'BATCH_SIZE': 50},
+#       'EMAIL': {'BACKEND': 'bus_booking.notifications.DjangoEmailBackend', 'RATE_PER_SECOND': 20, 'BATCH_SIZE': 100},
+#   }
+# RATE_PER_SECOND is enforced through RATE_LIMIT_BACKEND below.
+
+# Per-view limits keyed by the URL names in bus_booking/urls.py. 'ip' rules
+# are checked first; 'user' rules fall back to the IP for anonymous users.
+# Rates are "<count>/<s|m|h|d>". RATE_LIMIT_BACKEND is 'cache' (sliding
+# window shared by all workers through atomic Redis increments) or 'local'
+# (per-process token buckets, so the effective limit scales with the worker
+# count). The database cache is too slow and its incr() is not atomic, so
+# 'local' is used without Redis.
+RATE_LIMIT_BACKEND = 'cache' if REDIS_URL else 'local'
+RATE_LIMITS = {
+    'get_trip_price': [
+        {'key': 'ip', 'rate': '60/m'},
+    ],
+    'journey_search': [
+        {'key': 'ip', 'rate': '30/m'},
+    ],
+    'payment_page': [
+        {'key': 'ip', 'rate': '30/m', 'methods': ['POST']},
+        {'key': 'user', 'rate': '10/m', 'methods': ['POST']},
+    ],
+    'join_waitlist': [
+        {'key': 'user', 'rate': '10/m'},
+    ],
+    'login': [
+        {'key': 'ip', 'rate': '20/m', 'methods': ['POST']},
+    ],
+}
@@ -5,3 +5,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bus_booking_project.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.core import checks  # noqa: E402
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+
+# gunicorn does not run system checks; refuse to serve with a per-process cache.
+errors = [e for e in checks.run_checks(tags=[checks.Tags.caches]) if e.is_serious()]
+if errors:
+    raise ImproperlyConfigured("; ".join(str(e) for e in errors))
+
+if settings.WARM_UP_ON_START:
+    from bus_booking.warmup import warm_up
+    warm_up()
@@ -0,0 +1,33 @@
+# Production worker settings: gunicorn -c gunicorn.conf.py bus_booking_project.wsgi
+#
+# preload_app imports the Django app (and runs bus_booking.warmup via
+# wsgi.py) once in the master. Workers are then forked with compiled
+# templates and URL caches already in memory and share those pages
+# copy-on-write instead of each loading their own. Data that changes (the
+# journey index) is loaded per worker in post_fork.
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers do not touch (and un-share) the preloaded objects.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from django.conf import settings
+    from django.db import connections
+    connections.close_all()
+    # The journey index changes with every trip edit, so each worker builds
+    # its own rather than inheriting the master's boot-time copy.
+    if settings.WARM_UP_ON_START:
+        from bus_booking.warmup import warm_up_worker
+        warm_up_worker()